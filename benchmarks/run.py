@@ -0,0 +1,221 @@
+"""Time the library operations behind the GUI on synthetic libraries of growing size.
+
+For every size a library is generated into a temporary folder (see
+synthetic.py) and opened through open_store(), just as the app does, so the
+event log, lock files and indexes all live next to the data.  Measured are:
+
+    startup        init_data() and load(): reading the files and building every index
+    search_books   catalogue search, as typed into the student catalogue
+    find_students  typo-tolerant student lookup, as on the Issue Book screen
+    issue_book     issuing a book, including the fsynced event log append
+    return_book    returning it again
+    library_stats  the issued and overdue counts on the admin dashboard
+    loan_report    the borrowing report over five years of returned loans
+
+Each operation is reported as p50/p90/p99/max in milliseconds, together with
+the Python heap the loaded store holds and the peak resident size.  Run from
+the repository root:
+
+    python -m benchmarks.run                       # 1k, 10k, 100k and 1M books
+    python -m benchmarks.run --sizes 1000,10000 --json results.json
+
+Students are a tenth and current loans a quarter of the number of books;
+there are as many returned loans in the history as there are books.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import TITLE_WORDS, generate_library  # noqa: E402
+from library_store import DATE_FORMAT, open_store  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+STARTUP_RUNS = 3
+SEARCHES = 200
+ISSUES = 100
+STATS_CALLS = 1_000
+REPORTS = 5
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings):
+    timings = sorted(seconds * 1000 for seconds in timings)
+    return {"count": len(timings), "p50": percentile(timings, 0.50), "p90": percentile(timings, 0.90),
+            "p99": percentile(timings, 0.99), "max": timings[-1]}
+
+
+def timed(operation, arguments):
+    timings = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def book_queries(rng, store):
+    """What people type into the catalogue search: words, prefixes, word pairs, authors and ISBNs."""
+    books = list(store.books.values())
+    queries = []
+    for _ in range(SEARCHES):
+        kind = rng.random()
+        if kind < 0.4:
+            word = rng.choice(TITLE_WORDS)
+            queries.append(word[:rng.randint(3, len(word))])
+        elif kind < 0.7:
+            queries.append(" ".join(rng.sample(TITLE_WORDS, 2)))
+        elif kind < 0.9:
+            queries.append(rng.choice(books).author.split()[-1].lower())
+        else:
+            queries.append(rng.choice(books).isbn[:9])
+    return queries
+
+
+def student_queries(rng, store):
+    """Student names, IDs and misspelled names, as typed on the Issue Book screen."""
+    students = store.students()
+    queries = []
+    for _ in range(SEARCHES):
+        student = rng.choice(students)
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(student.name.lower())
+        elif kind < 0.6:
+            queries.append(student.user_id)
+        else:
+            name = list(student.name.lower())
+            i = rng.randrange(1, len(name) - 1)
+            name[i], name[i + 1] = name[i + 1], name[i]
+            queries.append("".join(name))
+    return queries
+
+
+def bench_size(books, seed, today):
+    students, loans, history = max(1, books // 10), books // 4, books
+    results = {"books": books, "students": students, "loans": loans, "history": history}
+    rng = random.Random(seed)
+
+    with tempfile.TemporaryDirectory(prefix="orchids-bench-") as directory:
+        generate_library(directory, books, students, loans, seed, today, history)
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            startups = []
+            for _ in range(STARTUP_RUNS if books <= 100_000 else 1):
+                gc.collect()
+                start = time.perf_counter()
+                store = open_store()
+                store.init_data()
+                store.load()
+                startups.append(time.perf_counter() - start)
+                store.close()
+            results["startup"] = summarize(startups)
+
+            # Tracing slows loading down several times over, so memory is measured on a separate load.
+            gc.collect()
+            tracemalloc.start()
+            store = open_store()
+            store.load()
+            results["store_mb"] = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+            tracemalloc.stop()
+
+            try:
+                results["search_books"] = summarize(timed(
+                    lambda query: store.search_books(query, available_only=True),
+                    [(query,) for query in book_queries(rng, store)]))
+                results["find_students"] = summarize(timed(
+                    store.find_students, [(query,) for query in student_queries(rng, store)]))
+
+                due_date = (today + timedelta(days=14)).strftime(DATE_FORMAT)
+                available = [book.book_id for book in store.books.values() if book.available_copies > 0]
+                issued = []
+                results["issue_book"] = summarize(timed(
+                    lambda book_id, student_id: issued.append(store.issue_book(book_id, student_id, due_date)),
+                    [(book_id, f"student{rng.randint(1, students)}")
+                     for book_id in rng.sample(available, min(ISSUES, len(available)))]))
+                results["return_book"] = summarize(timed(
+                    store.return_book, [(loan.loan_id,) for loan in issued]))
+
+                results["library_stats"] = summarize(timed(store.get_library_stats, [()] * STATS_CALLS))
+            finally:
+                store.close()
+
+            # Closing compacted the log, which moved the history into the columnar archive.
+            store = open_store()
+            try:
+                store.load(("users", "books"))
+                results["loan_report"] = summarize(timed(store.loan_report, [()] * REPORTS))
+            finally:
+                store.close()
+        finally:
+            os.chdir(cwd)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def print_results(results):
+    print(f"\n{results['books']:,} books, {results['students']:,} students, {results['loans']:,} loans, "
+          f"{results['history']:,} returned"
+          f" - store {results['store_mb']:.1f} MB"
+          + (f", peak RSS {results['peak_rss_mb']:.0f} MB" if results["peak_rss_mb"] is not None else ""))
+    print(f"  {'operation':<14}{'runs':>6}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for name in ("startup", "search_books", "find_students", "issue_book", "return_book", "library_stats",
+                 "loan_report"):
+        timing = results[name]
+        print(f"  {name:<14}{timing['count']:>6}" + "".join(
+            f"{timing[key]:>11.3f}" for key in ("p50", "p90", "p99", "max")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Orchids library store")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated numbers of books (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--today", help="reference date YYYY-MM-DD for the overdue mix (default: today)")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    today = date.fromisoformat(args.today) if args.today else date.today()
+    all_results = []
+    for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+        results = bench_size(size, args.seed, today)
+        print_results(results)
+        all_results.append(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"python": sys.version.split()[0], "platform": sys.platform, "seed": args.seed,
+                       "today": today.isoformat(), "results": all_results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
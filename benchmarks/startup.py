@@ -0,0 +1,70 @@
+"""Measure how long the app takes to show its login screen.
+
+The app is launched repeatedly with ORCHIDS_STARTUP_REPORT set, which makes
+it note when the login screen has been drawn and close again.  Reported are
+the time from launch to first frame, including starting the interpreter or
+the frozen executable, and the part of it spent after library_system started
+importing.  Run from the repository root:
+
+    python -m benchmarks.startup                        # python library_system.py
+    python -m benchmarks.startup --runs 20 build/exe.win-amd64-3.12/OrchidsLibrary.exe
+
+A frozen build is run from its own folder, where setup.py puts the data files.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.run import summarize  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMEOUT = 60
+
+
+def measure(command, cwd, runs):
+    launch_times, in_app_times = [], []
+    with tempfile.TemporaryDirectory(prefix="orchids-startup-") as directory:
+        report_file = os.path.join(directory, "startup.jsonl")
+        env = dict(os.environ, ORCHIDS_STARTUP_REPORT=report_file)
+        for _ in range(runs):
+            launched_at = time.time()
+            subprocess.run(command, cwd=cwd, env=env, timeout=TIMEOUT, check=True)
+            with open(report_file, 'r') as f:
+                report = json.loads(f.readlines()[-1])
+            launch_times.append(report["shown_at"] - launched_at)
+            in_app_times.append(report["first_frame_ms"] / 1000)
+    return {"launch_to_first_frame": summarize(launch_times), "import_to_first_frame": summarize(in_app_times)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the Orchids app's time to first frame")
+    parser.add_argument("executable", nargs="?", help="a frozen build to measure (default: python library_system.py)")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.executable:
+        command, cwd = [os.path.abspath(args.executable)], os.path.dirname(os.path.abspath(args.executable))
+    else:
+        command, cwd = [sys.executable, os.path.join(REPO_ROOT, "library_system.py")], REPO_ROOT
+
+    results = measure(command, cwd, args.runs)
+    print(f"{' '.join(command)} ({args.runs} runs)")
+    print(f"  {'':<24}{'p50 ms':>11}{'p90 ms':>11}{'max ms':>11}")
+    for name, timing in results.items():
+        print(f"  {name:<24}" + "".join(f"{timing[key]:>11.1f}" for key in ("p50", "p90", "max")))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"command": command, "runs": args.runs, **results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
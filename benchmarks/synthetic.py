@@ -0,0 +1,154 @@
+"""Deterministic synthetic library data for the benchmarks.
+
+generate_library writes users.json, books.json and borrowed_books.json in the
+app's own formats, and optionally years of returned loans into
+loan_history.jsonl.  The same seed, sizes and reference date always produce
+byte-identical files, so timings from different runs and branches can be
+compared.
+
+    python -m benchmarks.synthetic out_dir --books 10000 --students 1000 --loans 2500 --history 100000
+"""
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+
+DATE_FORMAT = "%Y-%m-%d"
+
+# Share of loans that are past their due date, and of those the share already fined.
+OVERDUE_SHARE = 0.15
+FINED_SHARE = 0.4
+LOAN_DAYS = 14
+# Returned loans are spread over this many years before today; students are in grades 6 to 12.
+HISTORY_YEARS = 5
+GRADES = tuple(f"Grade {grade}" for grade in range(6, 13))
+
+TITLE_WORDS = (
+    "python", "data", "science", "history", "modern", "introduction", "advanced", "guide", "world",
+    "programming", "learning", "machine", "algorithms", "chemistry", "physics", "biology", "art",
+    "music", "poetry", "ancient", "empire", "ocean", "garden", "stars", "mathematics", "calculus",
+    "geometry", "economics", "philosophy", "language", "stories", "secret", "journey", "river",
+    "mountain", "city", "war", "peace", "design", "systems", "networks", "databases", "statistics",
+    "english", "grammar", "novel", "classic", "children", "animals", "space", "time", "energy",
+)
+FIRST_NAMES = (
+    "John", "Jane", "Aarav", "Priya", "Liam", "Olivia", "Noah", "Emma", "Arjun", "Ananya", "Mateo",
+    "Sofia", "Wei", "Mei", "Omar", "Fatima", "Lucas", "Chloe", "Ravi", "Isha", "Ethan", "Mia",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Patel", "Sharma", "Garcia", "Chen", "Khan", "Williams", "Brown", "Singh",
+    "Rodriguez", "Kim", "Nguyen", "Wilson", "Iyer", "Taylor", "Martin", "Lee", "Gupta", "Clark",
+)
+
+
+def _isbn13(rng):
+    digits = [9, 7, 8] + [rng.randrange(10) for _ in range(9)]
+    check = (10 - sum(digit * (3 if i % 2 else 1) for i, digit in enumerate(digits)) % 10) % 10
+    text = "".join(map(str, digits + [check]))
+    return f"{text[:3]}-{text[3:]}"
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def generate_library(directory, books=1000, students=100, loans=250, seed=42, today=None, history=0):
+    """Write a library of the given size into directory and return the paths of the files written.
+
+    Loans are spread over the books so that no book is lent more often than
+    it has copies; OVERDUE_SHARE of them are past due on today.  history
+    returned loans are written too, returned at an even pace over the last
+    HISTORY_YEARS years.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    os.makedirs(directory, exist_ok=True)
+
+    users = {"admin": {"password": "admin123", "role": "admin", "name": "Administrator"}}
+    for i in range(1, students + 1):
+        users[f"student{i}"] = {"password": f"pass{i}", "role": "student", "name": _name(rng),
+                                "grade": GRADES[i % len(GRADES)]}
+
+    authors = [_name(rng) for _ in range(max(1, books // 8))]
+    book_data = {}
+    for i in range(1, books + 1):
+        copies = rng.choice((1, 1, 2, 2, 3, 4, 5))
+        title = " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(2, 5))).title()
+        book_data[str(i)] = {"title": title, "author": rng.choice(authors), "isbn": _isbn13(rng),
+                             "total_copies": copies, "available_copies": copies}
+
+    loan_data = {}
+    book_ids = list(book_data)
+    for i in range(1, loans + 1):
+        for _ in range(10):
+            book_id = rng.choice(book_ids)
+            if book_data[book_id]["available_copies"] > 0:
+                break
+        else:
+            break  # the sampled books are all out; the library is lent out as far as it goes
+        book_data[book_id]["available_copies"] -= 1
+
+        if rng.random() < OVERDUE_SHARE:
+            due = today - timedelta(days=rng.randint(1, 60))
+        else:
+            due = today + timedelta(days=rng.randint(0, LOAN_DAYS))
+        overdue = due <= today
+        loan_data[str(i)] = {
+            "book_id": book_id,
+            "student": f"student{rng.randint(1, students)}",
+            "issue_date": (due - timedelta(days=LOAN_DAYS)).strftime(DATE_FORMAT),
+            "due_date": due.strftime(DATE_FORMAT),
+            "fine": 5 if overdue and rng.random() < FINED_SHARE else 0,
+        }
+
+    paths = {}
+    for name, data in (("users", users), ("books", book_data), ("borrowed", loan_data)):
+        path = paths[name] = os.path.join(directory, "borrowed_books.json" if name == "borrowed" else f"{name}.json")
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+    if history:
+        paths.update(_write_history(directory, history, book_ids, students, loans, seed, today))
+    return paths
+
+
+def _write_history(directory, count, book_ids, students, loans, seed, today):
+    """Write count returned loans, as left behind by a compaction, and the checkpoint that goes with it."""
+    rng = random.Random(f"{seed}-history")
+    first_day = today - timedelta(days=365 * HISTORY_YEARS)
+    # Popular books are borrowed far more often than the rest
+    weights = [1 / rank for rank in range(1, len(book_ids) + 1)]
+    borrowed = rng.choices(book_ids, weights=weights, k=count)
+    paths = {"history": os.path.join(directory, "loan_history.jsonl"),
+             "checkpoint": os.path.join(directory, "library_checkpoint.json")}
+    with open(paths["history"], 'w') as f:
+        for i, book_id in enumerate(borrowed):
+            returned = first_day + timedelta(days=i * 365 * HISTORY_YEARS // count)
+            issued = returned - timedelta(days=rng.randint(1, 2 * LOAN_DAYS))
+            due = issued + timedelta(days=LOAN_DAYS)
+            f.write(json.dumps({
+                "seq": 1, "loan_id": str(loans + i + 1), "book_id": book_id,
+                "student": f"student{rng.randint(1, students)}",
+                "issue_date": issued.strftime(DATE_FORMAT), "due_date": due.strftime(DATE_FORMAT),
+                "fine": 5 if returned > due and rng.random() < FINED_SHARE else 0,
+                "return_date": returned.strftime(DATE_FORMAT),
+            }) + "\n")
+    with open(paths["checkpoint"], 'w') as f:
+        json.dump({"seq": 1}, f)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic Orchids library")
+    parser.add_argument("directory")
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--loans", type=int, default=250)
+    parser.add_argument("--history", type=int, default=0, help="returned loans to write (default: none)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    generate_library(args.directory, args.books, args.students, args.loans, args.seed, history=args.history)
+
+
+if __name__ == "__main__":
+    main()
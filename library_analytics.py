@@ -0,0 +1,288 @@
+"""Archive of returned loans and the borrowing reports computed from it.
+
+Returned loans are kept column by column: one array of 32-bit ints per field
+(book, student, issue, due and return date as ordinal day numbers, fine),
+with book and student IDs replaced by their position in a list of the
+distinct IDs.  A report then counts and sums whole arrays at C speed
+(collections.Counter, sum, map over operator functions, or numpy when it is
+installed, imported by the first report) instead of iterating over millions of loan dicts, so years of
+history are summarised in seconds.
+
+LoanArchive stores the columns in loan_archive/ as raw array files plus the
+two ID lists, one ID per line.  Every file is only ever appended to.
+archive.json records how many bytes of each file are complete and the
+sequence number of the last event archived; it is replaced last, so a crash
+mid-append leaves a tail that the next append cuts off again.
+"""
+import json
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import nlargest
+from itertools import compress
+from operator import ge
+
+ARCHIVE_DIR = "loan_archive"
+META_FILE = "archive.json"
+TYPECODE = "i"
+COLUMNS = ("book", "student", "issue", "due", "returned", "fine")
+ID_LISTS = ("book_ids", "student_ids")
+NO_GRADE = "No grade"
+
+_numpy_module = None  # numpy once the first report imported it, False if it is not installed
+
+
+class LoanColumns:
+    """Returned loans as one array per field, in the order they were returned.
+
+    book and student hold indexes into book_ids and student_ids; the date
+    columns hold date ordinals.
+    """
+
+    def __init__(self, book_ids=(), student_ids=()):
+        for name in COLUMNS:
+            setattr(self, name, array(TYPECODE))
+        self.book_ids = list(book_ids)
+        self.student_ids = list(student_ids)
+        self._book_codes = None
+        self._student_codes = None
+
+    def __len__(self):
+        return len(self.returned)
+
+    def append(self, book_id, student, issue_ordinal, due_ordinal, return_ordinal, fine):
+        if self._book_codes is None:
+            self._book_codes = {book_id: code for code, book_id in enumerate(self.book_ids)}
+            self._student_codes = {student: code for code, student in enumerate(self.student_ids)}
+        self.book.append(_code(self._book_codes, self.book_ids, book_id))
+        self.student.append(_code(self._student_codes, self.student_ids, student))
+        self.issue.append(issue_ordinal)
+        self.due.append(due_ordinal)
+        self.returned.append(return_ordinal)
+        self.fine.append(fine)
+
+    def extend(self, loans):
+        for loan in loans:
+            self.append(loan.book_id, loan.student, loan.issue_ordinal, loan.due_ordinal, loan.return_ordinal, loan.fine)
+
+    def rows_between(self, start=None, end=None):
+        """The range of rows returned from date ordinal start up to and including end."""
+        low = bisect_left(self.returned, start) if start is not None else 0
+        high = bisect_left(self.returned, end + 1) if end is not None else len(self)
+        return low, max(low, high)
+
+
+def _code(codes, ids, value):
+    code = codes.get(value)
+    if code is None:
+        code = codes[value] = len(ids)
+        ids.append(value)
+    return code
+
+
+class LoanArchive:
+    """The columns of every archived returned loan, kept in a directory of append-only files."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path(META_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"seq": 0, "sizes": {}}
+
+    @property
+    def seq(self):
+        """Sequence number of the last event whose returned loans are archived."""
+        return self._read_meta()["seq"]
+
+    def _read_file(self, name, size):
+        if not size:
+            return b""
+        with open(self._path(name), 'rb') as f:
+            return f.read(size)
+
+    def read(self):
+        """Load the archive into a LoanColumns."""
+        sizes = self._read_meta()["sizes"]
+        columns = LoanColumns(*(self._read_file(name, sizes.get(name, 0)).decode("utf-8").splitlines()
+                                for name in ID_LISTS))
+        for name in COLUMNS:
+            getattr(columns, name).frombytes(self._read_file(name, sizes.get(name, 0)))
+        return columns
+
+    def append(self, loans, seq):
+        """Archive returned loans up to event number seq; nothing is written for loans already archived."""
+        meta = self._read_meta()
+        if seq <= meta["seq"] and not loans:
+            return
+        columns = self.read()
+        rows, id_counts = len(columns), {name: len(getattr(columns, name)) for name in ID_LISTS}
+        columns.extend(loans)
+        tails = {name: getattr(columns, name)[rows:].tobytes() for name in COLUMNS}
+        tails.update({name: "".join(f"{item}\n" for item in getattr(columns, name)[id_counts[name]:]).encode("utf-8")
+                      for name in ID_LISTS})
+        self._write(meta["sizes"], tails, seq)
+
+    def rebuild(self, loans, seq):
+        """Replace the archive with the given returned loans."""
+        columns = LoanColumns()
+        columns.extend(loans)
+        data = {name: getattr(columns, name).tobytes() for name in COLUMNS}
+        data.update({name: "".join(f"{item}\n" for item in getattr(columns, name)).encode("utf-8")
+                     for name in ID_LISTS})
+        self._write({}, data, seq)
+
+    def _write(self, sizes, tails, seq):
+        os.makedirs(self.directory, exist_ok=True)
+        sizes = dict(sizes)
+        for name, data in tails.items():
+            path = self._path(name)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                # Cut off whatever an interrupted append left behind
+                f.truncate(sizes.get(name, 0))
+                f.seek(0, os.SEEK_END)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            sizes[name] = sizes.get(name, 0) + len(data)
+
+        tmp_path = self._path(META_FILE + ".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"seq": seq, "sizes": sizes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(META_FILE))
+
+
+# The aggregations below work on a range of rows [low, high) and use numpy when it is available.
+
+def _numpy_or_none():
+    """numpy, imported by the first report rather than at startup; None if it is not installed."""
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy_module = numpy
+    return _numpy_module or None
+
+
+def _numpy(numpy, column, low, high):
+    """A view of part of a column as a numpy array, without copying."""
+    if not column:
+        return numpy.zeros(0, dtype=numpy.int32)
+    return numpy.frombuffer(column, dtype=numpy.int32)[low:high]
+
+
+def _counts(codes, low, high, size, mask=None):
+    """How often each code from 0 to size - 1 occurs in the rows, optionally only where mask is true."""
+    numpy = _numpy_or_none()
+    if numpy is not None:
+        values = _numpy(numpy, codes, low, high)
+        if mask is not None:
+            values = values[mask]
+        return numpy.bincount(values, minlength=size).tolist()
+    values = codes[low:high]
+    counter = Counter(compress(values, mask) if mask is not None else values)
+    counts = [0] * size
+    for code, count in counter.items():
+        counts[code] = count
+    return counts
+
+
+def _late_mask(columns, low, high):
+    """Per row, whether the book came back on or after its due date, the day loans count as overdue."""
+    numpy = _numpy_or_none()
+    if numpy is not None:
+        return _numpy(numpy, columns.returned, low, high) >= _numpy(numpy, columns.due, low, high)
+    return list(map(ge, columns.returned[low:high], columns.due[low:high]))
+
+
+def _count_true(mask):
+    numpy = _numpy_or_none()
+    if numpy is not None:
+        return int(numpy.count_nonzero(mask))
+    return sum(mask)
+
+
+def _total(column, low, high):
+    numpy = _numpy_or_none()
+    if numpy is not None:
+        return int(_numpy(numpy, column, low, high).sum(dtype=numpy.int64))
+    return sum(column[low:high])
+
+
+def top_books(columns, low, high, limit=10):
+    """(book ID, number of loans) of the most borrowed books, most borrowed first."""
+    counts = _counts(columns.book, low, high, len(columns.book_ids))
+    ranked = nlargest(limit, range(len(counts)), key=counts.__getitem__)
+    return [(columns.book_ids[code], counts[code]) for code in ranked if counts[code]]
+
+
+def average_loan_days(columns, low, high):
+    """Average days from issue to return, or None without loans."""
+    if high <= low:
+        return None
+    return (_total(columns.returned, low, high) - _total(columns.issue, low, high)) / (high - low)
+
+
+def overdue_ratio(columns, low, high, late=None):
+    """Share of loans returned on or after their due date, or None without loans."""
+    if high <= low:
+        return None
+    late = _late_mask(columns, low, high) if late is None else late
+    return _count_true(late) / (high - low)
+
+
+def grade_rates(columns, low, high, users, late=None):
+    """Borrowing per grade: {grade: {"students", "borrowers", "loans", "loans_per_student", "overdue_ratio"}}.
+
+    Students without a grade are reported under NO_GRADE.
+    """
+    late = _late_mask(columns, low, high) if late is None else late
+    loans = _counts(columns.student, low, high, len(columns.student_ids))
+    late_loans = _counts(columns.student, low, high, len(columns.student_ids), late)
+
+    rates = {}
+
+    def grade_totals(user):
+        grade = (user.grade if user is not None else None) or NO_GRADE
+        return rates.setdefault(grade, {"students": 0, "borrowers": 0, "loans": 0, "late": 0})
+
+    for user in users.values():
+        if user.is_student:
+            grade_totals(user)["students"] += 1
+    for code, student in enumerate(columns.student_ids):
+        if loans[code]:
+            totals = grade_totals(users.get(student))
+            totals["borrowers"] += 1
+            totals["loans"] += loans[code]
+            totals["late"] += late_loans[code]
+
+    for grade in rates.values():
+        late_count = grade.pop("late")
+        grade["loans_per_student"] = grade["loans"] / grade["students"] if grade["students"] else None
+        grade["overdue_ratio"] = late_count / grade["loans"] if grade["loans"] else None
+    return dict(sorted(rates.items()))
+
+
+def loan_report(columns, users, books, start=None, end=None, top=10):
+    """Summarise the loans returned between date ordinals start and end (both optional, inclusive)."""
+    low, high = columns.rows_between(start, end)
+    late = _late_mask(columns, low, high)
+    return {
+        "loans": high - low,
+        "top_titles": [(books[book_id].title if book_id in books else book_id, count)
+                       for book_id, count in top_books(columns, low, high, top)],
+        "average_loan_days": average_loan_days(columns, low, high),
+        "overdue_ratio": overdue_ratio(columns, low, high, late),
+        "grades": grade_rates(columns, low, high, users, late),
+    }
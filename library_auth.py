@@ -0,0 +1,151 @@
+"""Password hashing and login throttling for the Orchids library app.
+
+Passwords are stored as salted scrypt hashes ("scrypt$n$r$p$salt$hash"), or
+as PBKDF2-SHA256 hashes ("pbkdf2_sha256$iterations$salt$hash") where Python
+was built without scrypt.  The work factors below can be raised at any time:
+older hashes keep working and are upgraded the next time their owner logs in.
+
+Libraries created before passwords were hashed still hold plaintext
+passwords.  Those are accepted too and hashed on the owner's next login, or
+all at once with:
+
+    python orchids.py hash-passwords
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+# scrypt costs 128 * SCRYPT_N * SCRYPT_R bytes of memory (16 MB) and 50-150 ms per login.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+# Failed logins allowed before an account is locked, and how long the lock lasts:
+# BASE_DELAY seconds, doubling with every further failure up to MAX_DELAY.
+FREE_ATTEMPTS = 3
+BASE_DELAY = 2.0
+MAX_DELAY = 300.0
+# Accounts whose failures are remembered; the oldest are forgotten beyond this.
+MAX_TRACKED = 10_000
+
+HAS_SCRYPT = hasattr(hashlib, "scrypt")
+
+
+class LoginThrottled(Exception):
+    """Raised instead of checking a password while the account is locked after failed logins."""
+
+    def __init__(self, retry_after):
+        seconds = max(1, round(retry_after))
+        super().__init__(f"Too many failed login attempts. Try again in {seconds} seconds.")
+        self.retry_after = retry_after
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r, dklen=HASH_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, dklen=HASH_BYTES)
+
+
+def hash_password(password):
+    """Hash a password with a fresh salt and the current work factor."""
+    salt = os.urandom(SALT_BYTES)
+    if HAS_SCRYPT:
+        digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+    digest = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+
+
+def is_hashed(stored):
+    return stored.startswith(("scrypt$", "pbkdf2_sha256$"))
+
+
+def verify_password(stored, password):
+    """Check a password against a stored hash, or a plaintext password from before hashing."""
+    if not is_hashed(stored):
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+
+    try:
+        scheme, *params, salt, digest = stored.split("$")
+        salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        if scheme == "scrypt":
+            n, r, p = map(int, params)
+            computed = _scrypt(password, salt, n, r, p)
+        else:
+            computed = _pbkdf2(password, salt, int(params[0]))
+    except ValueError:
+        return False
+    return hmac.compare_digest(computed, digest)
+
+
+def needs_rehash(stored):
+    """True for plaintext passwords and hashes made with another scheme or work factor than the current one."""
+    if HAS_SCRYPT:
+        return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not stored.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+_dummy_hash = None
+
+
+def waste_verification(password):
+    """Take as long as verify_password does, so unknown usernames cannot be told apart by timing."""
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password("")
+    verify_password(_dummy_hash, password)
+
+
+class LoginThrottle:
+    """Per-account backoff after failed logins.
+
+    After FREE_ATTEMPTS failures in a row an account is locked for
+    BASE_DELAY seconds, doubling with every further failure up to MAX_DELAY.
+    check() refuses a locked account before its password is hashed, so
+    guessing cannot keep the CPU busy.  Unknown usernames are tracked like
+    real ones.
+    """
+
+    def __init__(self, free_attempts=FREE_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, clock=time.monotonic):
+        self.free_attempts = free_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self._failures = {}  # username -> (failures in a row, locked until)
+        self._lock = threading.Lock()
+
+    def check(self, username):
+        """Raise LoginThrottled if the account is locked."""
+        with self._lock:
+            failures, locked_until = self._failures.get(username, (0, 0.0))
+        retry_after = locked_until - self.clock()
+        if retry_after > 0:
+            raise LoginThrottled(retry_after)
+
+    def failed(self, username):
+        with self._lock:
+            failures = self._failures.pop(username, (0, 0.0))[0] + 1
+            locked_until = 0.0
+            if failures >= self.free_attempts:
+                delay = min(self.max_delay, self.base_delay * 2 ** min(failures - self.free_attempts, 32))
+                locked_until = self.clock() + delay
+            self._failures[username] = (failures, locked_until)
+            if len(self._failures) > MAX_TRACKED:
+                del self._failures[next(iter(self._failures))]
+
+    def succeeded(self, username):
+        with self._lock:
+            self._failures.pop(username, None)
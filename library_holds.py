@@ -0,0 +1,168 @@
+"""Hold queues for books that are all out on loan.
+
+Students queue for a book with no copies left.  When a copy comes back it
+goes to the first hold in the book's queue, which becomes ready for pickup
+for HOLD_DAYS days; taking the first hold off a deque is O(1), however many
+students are waiting.  A ready hold that is not picked up in time expires and
+the copy passes to the next hold.
+
+Ready holds are filed in a timer wheel by the day they expire, so finding the
+expired ones only looks at the days that have passed since the last check,
+not at every hold.
+"""
+from collections import deque
+
+# Days a student has to pick up a copy kept for them.
+HOLD_DAYS = 3
+WHEEL_SLOTS = 64
+
+
+class ExpiryWheel:
+    """Hashed timer wheel of keys that expire at the end of a given day (a date ordinal).
+
+    Slot day % slots holds the keys expiring that day, or a whole number of
+    wheel turns later.
+    """
+
+    def __init__(self, slots=WHEEL_SLOTS):
+        self._slots = [{} for _ in range(slots)]
+        self._overdue = {}    # keys added with a day that had already been checked
+        self._checked = None  # every day before this one has been checked
+
+    def __len__(self):
+        return sum(map(len, self._slots)) + len(self._overdue)
+
+    def add(self, key, day):
+        if self._checked is not None and day < self._checked:
+            self._overdue[key] = day
+        else:
+            self._slots[day % len(self._slots)][key] = day
+
+    def remove(self, key, day):
+        self._overdue.pop(key, None)
+        self._slots[day % len(self._slots)].pop(key, None)
+
+    def due(self, today):
+        """The keys whose day is before today, as {key: day}; they stay in the wheel until removed."""
+        slots = len(self._slots)
+        if self._checked is None or today - self._checked >= slots:
+            days = range(slots)  # more than a whole turn: every slot is due
+        else:
+            days = range(self._checked, today)
+        due = dict(self._overdue)
+        for day in days:
+            due.update((key, expiry) for key, expiry in self._slots[day % slots].items() if expiry < today)
+        return due
+
+    def advance(self, today):
+        """Skip the days before today from now on; keys due by then that were not removed stay due."""
+        still_due = self.due(today)
+        self._checked = max(today, self._checked or today)
+        for key, day in still_due.items():
+            self.remove(key, day)
+            self.add(key, day)  # filed as overdue now
+
+    def expire(self, today):
+        """Remove and return the keys whose day is before today."""
+        due = self.due(today)
+        for key, day in due.items():
+            self.remove(key, day)
+        self.advance(today)
+        return list(due)
+
+
+class HoldQueues:
+    """The holds of every book: waiting ones in FIFO order and ready ones by the day they expire."""
+
+    def __init__(self, holds=()):
+        self._waiting = {}   # book ID -> deque of waiting holds, first come first
+        self._ready = {}     # book ID -> {student ID: ready hold}
+        self._holds = {}     # hold ID -> hold
+        self._students = {}  # student ID -> {book ID: hold}
+        self._wheel = ExpiryWheel()
+        for hold in sorted(holds, key=lambda hold: int(hold.hold_id)):
+            self.add(hold)
+
+    def __len__(self):
+        return len(self._holds)
+
+    def add(self, hold):
+        self._holds[hold.hold_id] = hold
+        self._students.setdefault(hold.student, {})[hold.book_id] = hold
+        if hold.is_ready:
+            self._ready.setdefault(hold.book_id, {})[hold.student] = hold
+            self._wheel.add(hold.hold_id, hold.expiry_ordinal)
+        else:
+            self._waiting.setdefault(hold.book_id, deque()).append(hold)
+
+    def remove(self, hold):
+        hold = self._holds.pop(hold.hold_id, None)
+        if hold is None:
+            return
+        held = self._students[hold.student]
+        del held[hold.book_id]
+        if not held:
+            del self._students[hold.student]
+        if hold.is_ready:
+            ready = self._ready[hold.book_id]
+            del ready[hold.student]
+            if not ready:
+                del self._ready[hold.book_id]
+            self._wheel.remove(hold.hold_id, hold.expiry_ordinal)
+        else:
+            waiting = self._waiting[hold.book_id]
+            if waiting[0] is hold:
+                waiting.popleft()
+            else:
+                waiting.remove(hold)
+            if not waiting:
+                del self._waiting[hold.book_id]
+
+    def replace(self, old, new):
+        """Swap hold old (None for a new hold) for new (None when it is gone)."""
+        if old is not None:
+            self.remove(old)
+        if new is not None:
+            self.add(new)
+
+    def next_waiting(self, book_id):
+        """The hold first in line for a copy of the book, or None."""
+        waiting = self._waiting.get(book_id)
+        return waiting[0] if waiting else None
+
+    def waiting_count(self, book_id):
+        return len(self._waiting.get(book_id, ()))
+
+    def ready_count(self, book_id):
+        return len(self._ready.get(book_id, ()))
+
+    def ready_hold(self, book_id, student_id):
+        """The student's hold on the book if a copy is being kept for them, else None."""
+        return self._ready.get(book_id, {}).get(student_id)
+
+    def position(self, hold):
+        """1 for the first waiting hold of its book, 2 for the next and so on; 0 for a ready hold."""
+        if hold.is_ready:
+            return 0
+        for position, waiting in enumerate(self._waiting.get(hold.book_id, ()), 1):
+            if waiting.hold_id == hold.hold_id:
+                return position
+        return None
+
+    def get(self, hold_id):
+        return self._holds.get(hold_id)
+
+    def student_hold(self, book_id, student_id):
+        """The student's hold on the book, waiting or ready, or None."""
+        return self._students.get(student_id, {}).get(book_id)
+
+    def student_holds(self, student_id):
+        return list(self._students.get(student_id, {}).values())
+
+    def expired(self, today):
+        """The ready holds that expired before date ordinal today; they stay queued until removed."""
+        return [self._holds[hold_id] for hold_id in self._wheel.due(today) if hold_id in self._holds]
+
+    def checked(self, today):
+        """Look only at later days in the next expired() call; expired holds not removed by then are kept."""
+        self._wheel.advance(today)
@@ -0,0 +1,231 @@
+"""Bulk catalogue import for the Orchids library app.
+
+Books are read one record at a time from CSV or MARC21 (ISO 2709) files,
+checked for a valid ISBN, deduplicated against the catalogue and each other,
+and added through LibraryStore.add_books in batches so that every batch costs
+one commit however many books it holds.
+
+Run it from the command line with:
+
+    python orchids.py import new_books.csv
+"""
+import csv
+import os
+from dataclasses import dataclass, field
+
+BATCH_SIZE = 500
+
+# CSV header names accepted for each book field, compared case-insensitively.
+CSV_COLUMNS = {
+    "title": ("title", "book title", "name"),
+    "author": ("author", "authors", "author name"),
+    "isbn": ("isbn", "isbn13", "isbn-13", "isbn10", "isbn-10"),
+    "copies": ("copies", "total_copies", "quantity", "qty", "number of copies"),
+}
+
+FIELD_TERMINATOR = 0x1E
+SUBFIELD_DELIMITER = 0x1F
+RECORD_TERMINATOR = 0x1D
+LEADER_LENGTH = 24
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import file cannot be parsed at all."""
+
+
+@dataclass
+class ImportResult:
+    added: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)   # (record number, message), capped at MAX_ERRORS
+    bytes_read: int = 0
+    total_bytes: int = 0
+
+    MAX_ERRORS = 100
+
+    @property
+    def fraction_done(self):
+        return self.bytes_read / self.total_bytes if self.total_bytes else 1.0
+
+    def add_error(self, record_number, message):
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append((record_number, message))
+
+    def summary(self):
+        return (f"{self.added} books added, {self.duplicates} duplicates skipped, "
+                f"{self.invalid} invalid records skipped")
+
+
+def normalize_isbn(isbn):
+    """Strip hyphens and spaces and upper-case a trailing check character X."""
+    return "".join(ch for ch in isbn if ch.isdigit() or ch in "xX").upper()
+
+
+def is_valid_isbn(isbn):
+    """Check the length and check digit of a normalized ISBN-10 or ISBN-13."""
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == "X"):
+        digits = [int(ch) for ch in isbn[:9]] + [10 if isbn[9] == "X" else int(isbn[9])]
+        return sum((10 - i) * digit for i, digit in enumerate(digits)) % 11 == 0
+    if len(isbn) == 13 and isbn.isdigit():
+        return sum(int(ch) * (3 if i % 2 else 1) for i, ch in enumerate(isbn)) % 10 == 0
+    return False
+
+
+# Readers yield (title, author, isbn, copies) tuples and report how far into the file they are.
+
+def iter_csv_books(f):
+    reader = csv.DictReader(f)
+    if not reader.fieldnames:
+        raise ImportFormatError("The CSV file has no header row.")
+
+    headers = {name.strip().lower(): name for name in reader.fieldnames if name}
+    columns = {}
+    for key, aliases in CSV_COLUMNS.items():
+        columns[key] = next((headers[alias] for alias in aliases if alias in headers), None)
+    missing = [key for key in ("title", "author", "isbn") if columns[key] is None]
+    if missing:
+        raise ImportFormatError(f"The CSV file has no {', '.join(missing)} column.")
+
+    for row in reader:
+        copies = row.get(columns["copies"]) if columns["copies"] else None
+        yield (row[columns["title"]] or "").strip(), (row[columns["author"]] or "").strip(), \
+            (row[columns["isbn"]] or "").strip(), (copies or "1").strip()
+
+
+def _marc_subfields(data):
+    """Split a MARC data field (after its two indicators) into {code: [values]}."""
+    subfields = {}
+    for chunk in data[2:].split(bytes([SUBFIELD_DELIMITER]))[1:]:
+        if chunk:
+            subfields.setdefault(chr(chunk[0]), []).append(chunk[1:])
+    return subfields
+
+
+def _parse_marc_record(record):
+    leader = record[:LEADER_LENGTH]
+    try:
+        base_address = int(leader[12:17])
+    except ValueError:
+        raise ValueError("bad MARC leader")
+    encoding = "utf-8" if leader[9:10] == b"a" else "latin-1"
+
+    fields = {}
+    directory = record[LEADER_LENGTH:base_address - 1]
+    for i in range(0, len(directory) - len(directory) % 12, 12):
+        tag = directory[i:i + 3].decode("ascii", "replace")
+        length = int(directory[i + 3:i + 7])
+        start = int(directory[i + 7:i + 12])
+        data = record[base_address + start:base_address + start + length].rstrip(bytes([FIELD_TERMINATOR]))
+        fields.setdefault(tag, []).append(data)
+
+    def first(tag, codes):
+        for data in fields.get(tag, ()):
+            subfields = _marc_subfields(data)
+            parts = [value.decode(encoding, "replace") for code in codes for value in subfields.get(code, ())]
+            if parts:
+                return " ".join(parts)
+        return ""
+
+    title = first("245", "ab").strip(" /:;,.")
+    author = (first("100", "a") or first("110", "a") or first("700", "a")).strip(" ,.")
+    isbn = first("020", "a").split(" ")[0] if "020" in fields else ""
+    return title, author, isbn, "1"
+
+
+def iter_marc_books(f):
+    """Stream records from a binary MARC21 file without loading it all into memory."""
+    while True:
+        leader = f.read(5)
+        if not leader or leader.strip(b"\r\n\x1a") == b"":
+            return
+        try:
+            length = int(leader)
+        except ValueError:
+            raise ImportFormatError("The file is not a MARC21 (ISO 2709) file.")
+        if length < LEADER_LENGTH:
+            raise ImportFormatError(f"The MARC file has a record of {length} bytes, shorter than its leader.")
+        record = leader + f.read(length - 5)
+        if len(record) < length or record[-1] != RECORD_TERMINATOR:
+            raise ImportFormatError("The MARC file ends in the middle of a record.")
+        try:
+            yield _parse_marc_record(record)
+        except ValueError:
+            yield "", "", "", "1"
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".mrc", ".marc", ".iso", ".dat"):
+        return "marc"
+    return "csv"
+
+
+def import_books(store, path, file_format=None, batch_size=BATCH_SIZE, progress=None):
+    """Import the books in a CSV or MARC21 file into the store.
+
+    progress, if given, is called with the running ImportResult after every
+    batch.  Returns the final ImportResult.
+    """
+    file_format = file_format or detect_format(path)
+    result = ImportResult(total_bytes=os.path.getsize(path))
+
+    seen_isbns = {normalize_isbn(book.isbn) for book in store.books.values()}
+    batch = []
+
+    def flush():
+        if batch:
+            store.add_books(batch)
+            result.added += len(batch)
+            batch.clear()
+        if progress is not None:
+            progress(result)
+
+    if file_format == "marc":
+        f = open(path, 'rb')
+        position = f.tell
+        books = iter_marc_books(f)
+    else:
+        f = open(path, 'r', newline='', encoding='utf-8-sig')
+        # The text layer reads ahead in chunks, so this position is approximate.
+        position = f.buffer.tell
+        books = iter_csv_books(f)
+
+    record_number = 0
+    with f:
+        try:
+            for record_number, (title, author, isbn, copies) in enumerate(books, start=1):
+                if not title or not author or not isbn:
+                    result.add_error(record_number, "missing title, author or ISBN")
+                    continue
+                normalized = normalize_isbn(isbn)
+                if not is_valid_isbn(normalized):
+                    result.add_error(record_number, f"invalid ISBN {isbn!r}")
+                    continue
+                try:
+                    copy_count = int(copies)
+                except ValueError:
+                    copy_count = 0
+                if copy_count <= 0:
+                    result.add_error(record_number, f"invalid number of copies {copies!r}")
+                    continue
+                if normalized in seen_isbns:
+                    result.duplicates += 1
+                    continue
+
+                seen_isbns.add(normalized)
+                batch.append((title, author, isbn, copy_count))
+                if len(batch) >= batch_size:
+                    result.bytes_read = position()
+                    flush()
+        except UnicodeDecodeError:
+            raise ImportFormatError(f"The CSV file is not UTF-8 text (after record {record_number}); save it as "
+                                    f"UTF-8 and import it again. {result.added} books were added before that.")
+        except csv.Error as e:
+            raise ImportFormatError(f"The CSV file is malformed after record {record_number}: {e}. "
+                                    f"{result.added} books were added before that.")
+
+    result.bytes_read = result.total_bytes
+    flush()
+    return result
@@ -0,0 +1,75 @@
+"""Indexes over the loans held by LibraryStore.
+
+DueDateIndex keeps every loan ordered by its due date (as a date ordinal
+parsed once per loan), so counting or listing overdue loans is a binary
+search instead of parsing every due date on every render.
+
+LoanIndex maps each student and each book to the IDs of their current loans,
+so "my books" and "who has this book" are lookups rather than scans.
+"""
+from bisect import bisect_right, insort
+from datetime import date
+
+
+class DueDateIndex:
+    def __init__(self, loans=()):
+        self._due = {}  # loan ID -> due date ordinal
+        self._entries = sorted((loan.due_ordinal, loan.loan_id) for loan in loans)
+        for due, loan_id in self._entries:
+            self._due[loan_id] = due
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, loan):
+        self.remove(loan.loan_id)
+        self._due[loan.loan_id] = loan.due_ordinal
+        insort(self._entries, (loan.due_ordinal, loan.loan_id))
+
+    def remove(self, loan_id):
+        due = self._due.pop(loan_id, None)
+        if due is not None:
+            position = bisect_right(self._entries, (due, loan_id)) - 1
+            del self._entries[position]
+
+    def _overdue_end(self, today):
+        today = (today or date.today()).toordinal()
+        # A loan is overdue from the start of its due date, as Loan.is_overdue defines it.
+        return bisect_right(self._entries, (today, "\uffff"))
+
+    def overdue_count(self, today=None):
+        return self._overdue_end(today)
+
+    def overdue_loan_ids(self, today=None):
+        """IDs of the overdue loans, the longest overdue first."""
+        return [loan_id for _, loan_id in self._entries[:self._overdue_end(today)]]
+
+
+class LoanIndex:
+    def __init__(self, loans=()):
+        # Dicts with None values are used as insertion-ordered sets.
+        self._by_student = {}  # student ID -> {loan ID: None}
+        self._by_book = {}     # book ID -> {loan ID: None}
+        for loan in loans:
+            self.add(loan)
+
+    def add(self, loan):
+        self._by_student.setdefault(loan.student, {})[loan.loan_id] = None
+        self._by_book.setdefault(loan.book_id, {})[loan.loan_id] = None
+
+    def remove(self, loan):
+        for index, key in ((self._by_student, loan.student), (self._by_book, loan.book_id)):
+            loan_ids = index.get(key)
+            if loan_ids is not None:
+                loan_ids.pop(loan.loan_id, None)
+                if not loan_ids:
+                    del index[key]
+
+    def student_loan_ids(self, student_id):
+        return list(self._by_student.get(student_id, ()))
+
+    def book_loan_ids(self, book_id):
+        return list(self._by_book.get(book_id, ()))
+
+    def borrower_ids(self):
+        return list(self._by_student)
@@ -0,0 +1,96 @@
+"""Cross-process file locks for the Orchids library app.
+
+Several librarian PCs may run the app against the same data folder, for
+example on a network share.  FileLock takes an advisory lock on a small lock
+file next to the data (fcntl.lockf on POSIX, msvcrt.locking on Windows), which
+local disks as well as NFS and SMB shares honour.  The operating system drops
+the lock when a program exits or crashes, so a stale lock never blocks the
+library.
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# How long to wait between attempts on Windows, which has no blocking lock call.
+RETRY_DELAY = 0.01
+
+
+class FileLock:
+    """An exclusive lock on path, shared with other programs but re-entrant within this one.
+
+    The lock belongs to the whole process, so it does not keep threads of the
+    same program apart; JsonBackend only takes it while holding its own
+    threading lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+
+    def acquire(self, blocking=True):
+        """Take the lock, waiting for other programs unless blocking is False; returns whether it was taken."""
+        if self._depth:
+            self._depth += 1
+            return True
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            locked = _lock(fd, blocking)
+        except BaseException:
+            os.close(fd)
+            raise
+        if not locked:
+            os.close(fd)
+            return False
+        self._fd = fd
+        self._depth = 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                _unlock(self._fd)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+if fcntl is not None:
+    def _lock(fd, blocking):
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (BlockingIOError, PermissionError):
+            return False
+        return True
+
+    def _unlock(fd):
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+else:
+    def _lock(fd, blocking):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(RETRY_DELAY)
+
+    def _unlock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
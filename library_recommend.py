@@ -0,0 +1,138 @@
+"""Recommendations of the "students who borrowed this also borrowed..." kind.
+
+Two books count as borrowed together each time one student borrows both
+within WINDOW different books of each other.  CoBorrowIndex is the sparse
+item-item matrix of those counts, but keeps only each book's KEEP most
+co-borrowed books, ranked, so recommending k books is a slice of that list.
+
+The matrix over the whole loan history is built in a batch (LibraryStore.
+build_recommendations, or python orchids.py recommend) and cached in
+recommendations.json.  Between batches every issued book is added with
+record(), which touches the WINDOW books the student borrowed last and
+re-ranks at most KEEP entries for each.  Until the first batch has run, only
+the loans issued since are counted.
+"""
+from array import array
+from collections import Counter
+
+# Books each student's last borrowings are paired with, and co-borrowed books kept per book.
+WINDOW = 20
+KEEP = 30
+# Book pairs collected before they are counted, bounding the memory a batch build needs.
+BATCH_PAIRS = 1_000_000
+
+
+class CoBorrowIndex:
+    def __init__(self):
+        self._counts = {}  # book ID -> {co-borrowed book ID: times borrowed together}
+        self._top = {}     # book ID -> co-borrowed book IDs, most often borrowed together first
+        self._recent = {}  # student ID -> the last WINDOW distinct books they borrowed, oldest first
+        self.last_loan_id = 0
+
+    def __len__(self):
+        return len(self._top)
+
+    @classmethod
+    def from_history(cls, columns, loans=()):
+        """Build the index from the returned loans in a LoanColumns plus the current loans."""
+        index = cls()
+        # Each pair of book codes is packed into one int, so Counter does the counting in C
+        pair_counts = Counter()
+        pairs = array("q")
+        recent = {}
+        for student, book in zip(columns.student, columns.book):
+            books = recent.setdefault(student, [])
+            if book in books:
+                books.remove(book)
+            else:
+                pairs.extend([book << 32 | other for other in books])
+                pairs.extend([other << 32 | book for other in books])
+                if len(pairs) >= BATCH_PAIRS:
+                    pair_counts.update(pairs)
+                    del pairs[:]
+            books.append(book)
+            if len(books) > WINDOW:
+                del books[0]
+        pair_counts.update(pairs)
+
+        co_borrowed = {}
+        for pair, count in pair_counts.items():
+            # Negated counts sort most borrowed first without a key function
+            co_borrowed.setdefault(pair >> 32, []).append((-count, pair & 0xFFFFFFFF))
+        book_ids, student_ids = columns.book_ids, columns.student_ids
+        for book, counts in co_borrowed.items():
+            top = sorted(counts)[:KEEP]
+            index._counts[book_ids[book]] = {book_ids[other]: -count for count, other in top}
+            index._top[book_ids[book]] = [book_ids[other] for _, other in top]
+        index._recent = {student_ids[student]: [book_ids[book] for book in books] for student, books in recent.items()}
+
+        for loan in sorted(loans, key=lambda loan: int(loan.loan_id)):
+            index.record(loan.student, loan.book_id, loan.loan_id)
+        return index
+
+    def record(self, student_id, book_id, loan_id=None):
+        """Add a newly issued loan."""
+        if loan_id is not None:
+            self.last_loan_id = max(self.last_loan_id, int(loan_id))
+        recent = self._recent.setdefault(student_id, [])
+        if book_id in recent:
+            # Borrowing a book again says nothing new about what goes with it
+            recent.remove(book_id)
+        else:
+            for other in recent:
+                self._bump(book_id, other)
+                self._bump(other, book_id)
+        recent.append(book_id)
+        if len(recent) > WINDOW:
+            del recent[0]
+
+    def _bump(self, book_id, other):
+        counts = self._counts.setdefault(book_id, {})
+        count = counts[other] = counts.get(other, 0) + 1
+        top = self._top.setdefault(book_id, [])
+        if other in top:
+            position = top.index(other)
+        elif len(top) < KEEP:
+            top.append(other)
+            position = len(top) - 1
+        elif count > counts[top[-1]]:
+            top[-1] = other
+            position = len(top) - 1
+        else:
+            return
+        while position and counts[top[position - 1]] < count:
+            top[position - 1], top[position] = top[position], top[position - 1]
+            position -= 1
+
+    def recommend(self, book_id, k=5):
+        """The k books most often borrowed together with book_id."""
+        return self._top.get(book_id, [])[:k]
+
+    def recommend_for_student(self, student_id, k=5):
+        """The k books most often borrowed with the student's recent books, leaving out those books."""
+        recent = self._recent.get(student_id, [])
+        scores = Counter()
+        for book_id in recent:
+            counts = self._counts.get(book_id, {})
+            for other in self._top.get(book_id, ()):
+                scores[other] += counts[other]
+        for book_id in recent:
+            scores.pop(book_id, None)
+        return [book_id for book_id, _ in scores.most_common(k)]
+
+    def to_json(self):
+        return {"last_loan_id": self.last_loan_id,
+                "books": {book_id: [[other, self._counts[book_id][other]] for other in top]
+                          for book_id, top in self._top.items() if top},
+                "recent": self._recent}
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        index.last_loan_id = data.get("last_loan_id", 0)
+        for book_id, top in data.get("books", {}).items():
+            index._counts[book_id] = {other: count for other, count in top}
+            index._top[book_id] = [other for other, _ in top]
+        index._recent = {student_id: list(books) for student_id, books in data.get("recent", {}).items()}
+        return index
+
@@ -0,0 +1,85 @@
+"""Rating totals over the book reviews held by LibraryStore.
+
+RatingIndex keeps each book's review count, rating sum and histogram of 1-5
+star ratings, updated as reviews are added or replaced, so showing a book's
+average never reads its reviews.  Books are also kept ranked by average
+rating, so sorting even the whole catalogue by rating is a walk down that
+ranking rather than a sort.
+"""
+from bisect import bisect_left, insort
+
+STARS = 5
+# Sorting n books directly costs about n log n; walking the ranking costs its length.  Walk it
+# when the books to sort are more than this fraction of the rated books.
+WALK_FRACTION = 1 / 16
+
+
+class RatingIndex:
+    def __init__(self, reviews=()):
+        self._totals = {}  # book ID -> [review count, rating sum, [count of 1-star, ..., 5-star reviews]]
+        for review in reviews:
+            self._count(review, 1)
+        self._keys = {book_id: self._rank_key(book_id, totals) for book_id, totals in self._totals.items()}
+        self._ranked = sorted(self._keys.values())  # (-average, -count, book ID), best rated first
+
+    def __len__(self):
+        return len(self._totals)
+
+    @staticmethod
+    def _rank_key(book_id, totals):
+        count, total, _ = totals
+        return -total / count, -count, book_id
+
+    def _count(self, review, sign):
+        totals = self._totals.get(review.book_id)
+        if totals is None:
+            totals = self._totals[review.book_id] = [0, 0, [0] * STARS]
+        totals[0] += sign
+        totals[1] += sign * review.rating
+        totals[2][review.rating - 1] += sign
+        if not totals[0]:
+            del self._totals[review.book_id]
+
+    def _rerank(self, book_id):
+        key = self._keys.pop(book_id, None)
+        if key is not None:
+            del self._ranked[bisect_left(self._ranked, key)]
+        totals = self._totals.get(book_id)
+        if totals is not None:
+            key = self._keys[book_id] = self._rank_key(book_id, totals)
+            insort(self._ranked, key)
+
+    def replace(self, old, new):
+        """Swap review old (None for a first review) for new (None when it is withdrawn)."""
+        for review, sign in ((old, -1), (new, 1)):
+            if review is not None:
+                self._count(review, sign)
+        for book_id in {review.book_id for review in (old, new) if review is not None}:
+            self._rerank(book_id)
+
+    def add(self, review):
+        self.replace(None, review)
+
+    def remove(self, review):
+        self.replace(review, None)
+
+    def summary(self, book_id):
+        """(average rating, number of reviews) of a book; the average is None if it has none."""
+        totals = self._totals.get(book_id)
+        if totals is None:
+            return None, 0
+        return totals[1] / totals[0], totals[0]
+
+    def histogram(self, book_id):
+        """Number of 1-star, 2-star, ... 5-star reviews of a book."""
+        totals = self._totals.get(book_id)
+        return list(totals[2]) if totals is not None else [0] * STARS
+
+    def sort(self, book_ids):
+        """The given book IDs, best rated first; books without reviews follow in their original order."""
+        if len(book_ids) < len(self._ranked) * WALK_FRACTION:
+            ranked = sorted(self._keys[book_id] for book_id in book_ids if book_id in self._keys)
+        else:
+            wanted = set(book_ids)
+            ranked = [key for key in self._ranked if key[2] in wanted]
+        return [key[2] for key in ranked] + [book_id for book_id in book_ids if book_id not in self._keys]
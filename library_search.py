@@ -0,0 +1,289 @@
+"""In-memory search indexes for the Orchids library app.
+
+CatalogIndex is a tokenized inverted index over book titles, authors and
+ISBNs.  Every query term is treated as a prefix, all terms must match (AND),
+and results are ranked so that exact word matches beat prefix matches and
+title matches beat author and ISBN matches.
+
+StudentIndex is a trigram index over student names and IDs for typo-tolerant
+lookup while a librarian types.
+"""
+import heapq
+import itertools
+import re
+from bisect import bisect_left, insort
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+# Hyphens inside a number (as in ISBNs) are dropped so "978-0123" stays one token.
+_NUMBER_HYPHEN_RE = re.compile(r"(?<=\d)-(?=[\dx])")
+
+# Ranked postings are cached for this many query terms at a time.
+TERM_CACHE_SIZE = 256
+
+# Share of the query's trigrams a student must contain to be returned.
+MIN_TRIGRAM_COVERAGE = 0.5
+# Added to the score when the query appears verbatim in the name or ID.
+SUBSTRING_BONUS = 1.0
+
+# Scoring one candidate book directly costs about as much as reading this many posting entries.
+NARROW_COST = 4
+
+# Field weights used for ranking; an exact token match scores double.
+TITLE_WEIGHT = 3
+AUTHOR_WEIGHT = 2
+ISBN_WEIGHT = 1
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(_NUMBER_HYPHEN_RE.sub("", text.lower()))
+
+
+def _book_tokens(book):
+    """Map every token of a book to the weight of the best field it appears in."""
+    tokens = {}
+    # Fields go from lowest to highest weight, so the best field is written last.
+    for weight, text in ((ISBN_WEIGHT, book.isbn), (AUTHOR_WEIGHT, book.author), (TITLE_WEIGHT, book.title)):
+        for token in tokenize(text):
+            tokens[token] = weight
+    return tokens
+
+
+class CatalogIndex:
+    def __init__(self, books=()):
+        self._postings = {}     # token -> {book_id: weight}
+        self._vocabulary = []   # sorted list of every indexed token
+        self._doc_tokens = {}   # book_id -> {token: weight}
+        self._term_cache = {}   # term -> [scores, book IDs ranked by score or None until needed]
+        for book in books:
+            tokens = self._doc_tokens[book.book_id] = _book_tokens(book)
+            for token, weight in tokens.items():
+                self._postings.setdefault(token, {})[book.book_id] = weight
+        self._vocabulary = sorted(self._postings)
+
+    def __len__(self):
+        return len(self._doc_tokens)
+
+    def __contains__(self, book_id):
+        return book_id in self._doc_tokens
+
+    def add(self, book):
+        """Index a new book, or re-index one whose title, author or ISBN changed."""
+        if book.book_id in self._doc_tokens:
+            self.remove(book.book_id)
+        self._term_cache.clear()
+        tokens = _book_tokens(book)
+        self._doc_tokens[book.book_id] = tokens
+        for token, weight in tokens.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            posting[book.book_id] = weight
+
+    update = add
+
+    def remove(self, book_id):
+        tokens = self._doc_tokens.pop(book_id, None)
+        if tokens is None:
+            return
+        self._term_cache.clear()
+        for token in tokens:
+            posting = self._postings[token]
+            del posting[book_id]
+            if not posting:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _prefix_range(self, term):
+        start = bisect_left(self._vocabulary, term)
+        end = bisect_left(self._vocabulary, term + "\uffff", start)
+        return start, end
+
+    def _term_entry(self, term, start, end):
+        cached = self._term_cache.get(term)
+        if cached is not None:
+            return cached
+
+        scores = {}
+        for token in self._vocabulary[start:end]:
+            exact = token == term
+            for book_id, weight in self._postings[token].items():
+                score = weight * 2 if exact else weight
+                if score > scores.get(book_id, 0):
+                    scores[book_id] = score
+
+        if len(self._term_cache) >= TERM_CACHE_SIZE:
+            self._term_cache.clear()
+        cached = self._term_cache[term] = [scores, None]
+        return cached
+
+    def _term_scores(self, term, start, end):
+        """Score every book matching one term: {book ID: score}."""
+        return self._term_entry(term, start, end)[0]
+
+    def _term_ranking(self, term, start, end):
+        """The IDs of the books matching one term, best first."""
+        cached = self._term_entry(term, start, end)
+        if cached[1] is None:
+            scores = cached[0]
+            cached[1] = sorted(scores, key=scores.get, reverse=True)
+        return cached[1]
+
+    def _doc_term_score(self, book_id, term):
+        best = 0
+        for token, weight in self._doc_tokens[book_id].items():
+            if token.startswith(term):
+                score = weight * 2 if token == term else weight
+                if score > best:
+                    best = score
+        return best
+
+    def search(self, query, limit=None, where=None, within=None):
+        """Return the IDs of books matching every term of the query, best first.
+
+        where, if given, is a predicate on the book ID used to drop results
+        (for example books with no copies left) before they are ranked.
+        within, if given, holds book IDs known to include every match (the
+        results of an earlier query this one extends).  They are scored
+        directly when that is cheaper than expanding the query's postings.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        ranges = []
+        for term in terms:
+            start, end = self._prefix_range(term)
+            if start == end:
+                return []
+            ranges.append((sum(len(self._postings[token]) for token in self._vocabulary[start:end]), term, start, end))
+
+        # Expand the most selective term, then check the others per candidate.
+        ranges.sort()
+        if within is not None and len(within) * NARROW_COST < ranges[0][0]:
+            scores = {}
+            for book_id in within:
+                if book_id not in self._doc_tokens:
+                    continue
+                total = 0
+                for term in terms:
+                    score = self._doc_term_score(book_id, term)
+                    if not score:
+                        break
+                    total += score
+                else:
+                    scores[book_id] = total
+            return self._rank(scores, limit, where)
+
+        _, first_term, start, end = ranges[0]
+        if len(ranges) == 1:
+            # Single term: walk the cached ranking and stop once enough books pass the filter.
+            ranked = self._term_ranking(first_term, start, end)
+            if where is not None:
+                ranked = (book_id for book_id in ranked if where(book_id))
+            return list(itertools.islice(ranked, limit))
+
+        # Intersect with the other terms' postings, unless so few candidates are left
+        # that checking their own tokens is cheaper than reading a term's postings.
+        scores = self._term_scores(first_term, start, end)
+        for postings, term, start, end in ranges[1:]:
+            if len(scores) * NARROW_COST < postings:
+                narrowed = {}
+                for book_id, score in scores.items():
+                    term_score = self._doc_term_score(book_id, term)
+                    if term_score:
+                        narrowed[book_id] = score + term_score
+                scores = narrowed
+            else:
+                term_scores = self._term_scores(term, start, end)
+                # Kept in the first term's order, so ties rank the same way every time
+                scores = {book_id: score + term_scores[book_id]
+                          for book_id, score in scores.items() if book_id in term_scores}
+        return self._rank(scores, limit, where)
+
+    @staticmethod
+    def _rank(scores, limit, where):
+        if where is not None:
+            scores = {book_id: score for book_id, score in scores.items() if where(book_id)}
+
+        if limit is not None:
+            return heapq.nlargest(limit, scores, key=scores.get)
+        return sorted(scores, key=scores.get, reverse=True)
+
+
+def _trigrams(text, complete=True):
+    """Trigrams of every word, padded at the start of each word.
+
+    Words are also padded at the end unless complete is False, which is used
+    for a query the user is still typing so a partial last word still matches.
+    """
+    grams = set()
+    words = tokenize(text)
+    for i, word in enumerate(words):
+        padded = "  " + word + (" " if complete or i < len(words) - 1 else "")
+        for j in range(len(padded) - 2):
+            grams.add(padded[j:j + 3])
+    return grams
+
+
+class StudentIndex:
+    def __init__(self, students=()):
+        self._postings = {}     # trigram -> set of student IDs
+        self._students = {}     # student ID -> (lowercase search text, trigram count)
+        for student in students:
+            self.add(student)
+
+    def __len__(self):
+        return len(self._students)
+
+    def add(self, student):
+        """Index a student, replacing any earlier entry for the same ID."""
+        self.remove(student.user_id)
+        text = f"{student.name} {student.user_id}"
+        grams = _trigrams(text)
+        self._students[student.user_id] = (text.lower(), len(grams))
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(student.user_id)
+
+    update = add
+
+    def remove(self, student_id):
+        entry = self._students.pop(student_id, None)
+        if entry is None:
+            return
+        for gram in _trigrams(entry[0]):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(student_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def search(self, query, limit=5):
+        """Return up to limit student IDs ranked by how well they match the query.
+
+        A student matches when it shares most of the query's trigrams, so
+        small typos ("jonh") still find "John".
+        """
+        query_text = query.strip().lower()
+        query_grams = _trigrams(query_text, complete=False)
+        if not query_grams:
+            return []
+
+        shared = {}
+        for gram in query_grams:
+            for student_id in self._postings.get(gram, ()):
+                shared[student_id] = shared.get(student_id, 0) + 1
+
+        scored = []
+        for student_id, count in shared.items():
+            coverage = count / len(query_grams)
+            if coverage < MIN_TRIGRAM_COVERAGE:
+                continue
+            text, gram_count = self._students[student_id]
+            similarity = count / (len(query_grams) + gram_count - count)
+            score = coverage + similarity
+            if query_text in text:
+                score += SUBSTRING_BONUS
+            scored.append((score, student_id))
+
+        return [student_id for _, student_id in heapq.nlargest(limit, scored)]
@@ -0,0 +1,320 @@
+"""HTTP/JSON API for the Orchids library, so many terminals can share one library.
+
+The server runs on asyncio and handles each connection concurrently.  Library
+operations are run on worker threads against stores checked out of a
+StorePool, so a slow disk write never stalls other requests.  Start it with:
+
+    python orchids.py serve --port 8080
+
+Endpoints (all responses are JSON):
+
+    GET  /books?q=python&available=1&limit=50   catalogue search
+    GET  /books/<book_id>                       one book and who has it
+    GET  /students?q=jonh&limit=5               fuzzy student lookup
+    GET  /loans?student=<id> | ?book=<id>       current loans
+    GET  /loans/overdue                         overdue loans, longest overdue first
+    POST /loans   {"book_id", "student", "due_date"}   issue a book
+    POST /loans/<loan_id>/return                return a book
+    POST /loans/<loan_id>/fine  {"amount": 5}   apply a fine
+    GET  /stats                                 issued and overdue counts
+"""
+import asyncio
+import hmac
+import json
+import re
+import traceback
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
+
+from library_store import DATE_FORMAT, FINE_AMOUNT, JsonBackend, LibraryError
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+DEFAULT_LOAN_DAYS = 14
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found",
+               405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class StorePool:
+    """A fixed set of open LibraryStore handles shared by all requests.
+
+    Each request checks a store out, uses it on a worker thread and returns
+    it, so stores are opened once rather than per request and no store is
+    used by two threads at once.  Every handle keeps its own in-memory cache,
+    so a pool larger than one only pays off for read-heavy SQLite setups.  The
+    JSON files have a single event log that only one handle may append to, so
+    a JSON store is always served from a pool of one.
+    """
+
+    def __init__(self, open_store, size=1):
+        self._stores = [open_store()]
+        if not isinstance(self._stores[0].backend, JsonBackend):
+            self._stores += [open_store() for _ in range(size - 1)]
+        self._available = asyncio.Queue()
+        for store in self._stores:
+            self._available.put_nowait(store)
+
+    async def run(self, operation, *args):
+        store = await self._available.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, operation, store, *args)
+        finally:
+            self._available.put_nowait(store)
+
+    def close(self):
+        for store in self._stores:
+            store.close()
+
+
+def book_json(book):
+    return {"id": book.book_id, **book.to_dict()}
+
+
+def loan_json(loan):
+    return {"id": loan.loan_id, **loan.to_dict(), "overdue": loan.is_overdue()}
+
+
+def user_json(user):
+    return {"id": user.user_id, "name": user.name, "role": user.role}
+
+
+# Store operations, run on worker threads
+
+def search_books(store, query, available_only, limit):
+    return [book_json(book) for book in store.search_books(query, available_only=available_only, limit=limit)]
+
+
+def get_book(store, book_id):
+    book = store.books.get(book_id)
+    if book is None:
+        raise HttpError(404, "Book not found")
+    return {**book_json(book), "loans": [loan_json(loan) for loan in store.book_loans(book_id)]}
+
+
+def find_students(store, query, limit):
+    return [user_json(user) for user in store.find_students(query, limit=limit)]
+
+
+def list_loans(store, student_id, book_id):
+    if student_id:
+        loans = store.user_loans(student_id)
+    elif book_id:
+        loans = store.book_loans(book_id)
+    else:
+        loans = store.loans.values()
+    return [loan_json(loan) for loan in loans]
+
+
+def list_overdue(store):
+    return [loan_json(loan) for loan in store.overdue_loans()]
+
+
+def issue_book(store, book_id, student_id, due_date):
+    if student_id not in store.users:
+        raise HttpError(404, "Student not found")
+    return loan_json(store.issue_book(book_id, student_id, due_date))
+
+
+def return_book(store, loan_id):
+    loan = store.return_book(loan_id)
+    if loan is None:
+        raise HttpError(404, "Loan not found")
+    return loan_json(loan)
+
+
+def apply_fine(store, loan_id, amount):
+    loan = store.apply_fine(loan_id, amount)
+    if loan is None:
+        raise HttpError(404, "Loan not found")
+    return loan_json(loan)
+
+
+def library_stats(store):
+    total_issued, overdue_count = store.get_library_stats()
+    return {"total_issued": total_issued, "overdue_count": overdue_count, "books": len(store.books)}
+
+
+class LibraryServer:
+    def __init__(self, pool, token=None):
+        self.pool = pool
+        self.token = token
+        self.routes = [
+            ("GET", re.compile(r"/books"), self.get_books),
+            ("GET", re.compile(r"/books/(?P<book_id>[^/]+)"), self.get_book),
+            ("GET", re.compile(r"/students"), self.get_students),
+            ("GET", re.compile(r"/loans"), self.get_loans),
+            ("GET", re.compile(r"/loans/overdue"), self.get_overdue),
+            ("POST", re.compile(r"/loans"), self.post_loan),
+            ("POST", re.compile(r"/loans/(?P<loan_id>[^/]+)/return"), self.post_return),
+            ("POST", re.compile(r"/loans/(?P<loan_id>[^/]+)/fine"), self.post_fine),
+            ("GET", re.compile(r"/stats"), self.get_stats),
+        ]
+
+    # Handlers
+
+    async def get_books(self, query, body):
+        limit = _int_param(query, "limit", 50)
+        return 200, await self.pool.run(search_books, query.get("q", ""), query.get("available") == "1", limit)
+
+    async def get_book(self, query, body, book_id):
+        return 200, await self.pool.run(get_book, book_id)
+
+    async def get_students(self, query, body):
+        return 200, await self.pool.run(find_students, query.get("q", ""), _int_param(query, "limit", 5))
+
+    async def get_loans(self, query, body):
+        return 200, await self.pool.run(list_loans, query.get("student"), query.get("book"))
+
+    async def get_overdue(self, query, body):
+        return 200, await self.pool.run(list_overdue)
+
+    async def post_loan(self, query, body):
+        if not body.get("book_id") or not body.get("student"):
+            raise HttpError(400, "book_id and student are required")
+        due_date = body.get("due_date") or (datetime.now() + timedelta(days=DEFAULT_LOAN_DAYS)).strftime(DATE_FORMAT)
+        try:
+            datetime.strptime(due_date, DATE_FORMAT)
+        except (TypeError, ValueError):
+            raise HttpError(400, "due_date must be a date in YYYY-MM-DD format")
+        return 201, await self.pool.run(issue_book, str(body["book_id"]), str(body["student"]), due_date)
+
+    async def post_return(self, query, body, loan_id):
+        return 200, await self.pool.run(return_book, loan_id)
+
+    async def post_fine(self, query, body, loan_id):
+        amount = body.get("amount", FINE_AMOUNT)
+        if isinstance(amount, bool) or not isinstance(amount, int) or amount <= 0:
+            raise HttpError(400, "amount must be a positive whole number")
+        return 200, await self.pool.run(apply_fine, loan_id, amount)
+
+    async def get_stats(self, query, body):
+        return 200, await self.pool.run(library_stats)
+
+    # HTTP plumbing
+
+    async def dispatch(self, method, target, headers, body):
+        if self.token is not None:
+            supplied = headers.get("authorization", "")
+            if not hmac.compare_digest(supplied, f"Bearer {self.token}"):
+                raise HttpError(401, "Missing or invalid API token")
+
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip("/") or "/"
+
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            if body:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    raise HttpError(400, "Request body is not valid JSON")
+                if not isinstance(body, dict):
+                    raise HttpError(400, "Request body must be a JSON object")
+            return await handler(query, body or {}, **match.groupdict())
+        if allowed:
+            raise HttpError(405, f"{method} is not allowed on {path}")
+        raise HttpError(404, f"No such endpoint: {path}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self.dispatch(method, target, headers, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except LibraryError as e:
+                    status, payload = 409, {"error": str(e)}
+                except Exception:
+                    traceback.print_exc()
+                    status, payload = 500, {"error": "Internal server error"}
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await _write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            await _write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _int_param(query, name, default):
+    try:
+        return max(1, int(query.get(name, default)))
+    except ValueError:
+        raise HttpError(400, f"{name} must be a whole number")
+
+
+async def _read_request(reader):
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, "Incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def _write_response(writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+
+async def serve(open_store, host="127.0.0.1", port=8080, pool_size=1, token=None):
+    pool = StorePool(open_store, pool_size)
+    server = LibraryServer(pool, token)
+    listener = await asyncio.start_server(server.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Orchids library API listening on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        pool.close()
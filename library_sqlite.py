@@ -0,0 +1,407 @@
+"""SQLite storage backend for the Orchids library app.
+
+SqliteBackend keeps the library in orchids_library.db with one table per
+record type.  Changes are written as row-level upserts inside a single
+transaction, so issuing or returning a book costs the same however large the
+catalogue grows.  Run this module directly to migrate the JSON files into the
+database once:
+
+    python library_sqlite.py
+"""
+import itertools
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+
+from library_analytics import LoanColumns
+from library_store import (DEFAULT_BOOKS, SQLITE_FILE, Book, Hold, JsonBackend, LibraryError, Loan, Review, User,
+                           default_users)
+from library_trace import span, traced
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL,
+    name TEXT NOT NULL,
+    grade TEXT
+);
+CREATE TABLE IF NOT EXISTS books (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    total_copies INTEGER NOT NULL,
+    available_copies INTEGER NOT NULL CHECK (available_copies >= 0)
+);
+CREATE TABLE IF NOT EXISTS loans (
+    id TEXT PRIMARY KEY,
+    book_id TEXT NOT NULL REFERENCES books(id),
+    student TEXT NOT NULL REFERENCES users(id),
+    issue_date TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    fine INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS loan_history (
+    id TEXT PRIMARY KEY,
+    book_id TEXT NOT NULL,
+    student TEXT NOT NULL,
+    issue_date TEXT NOT NULL,
+    due_date TEXT NOT NULL,
+    fine INTEGER NOT NULL DEFAULT 0,
+    return_date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    book_id TEXT NOT NULL REFERENCES books(id),
+    user TEXT NOT NULL REFERENCES users(id),
+    rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
+    comment TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS holds (
+    id TEXT PRIMARY KEY,
+    book_id TEXT NOT NULL REFERENCES books(id),
+    student TEXT NOT NULL REFERENCES users(id),
+    placed_date TEXT NOT NULL,
+    expiry_date TEXT
+);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+CREATE INDEX IF NOT EXISTS idx_books_isbn ON books(isbn);
+CREATE INDEX IF NOT EXISTS idx_books_title ON books(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_loans_student ON loans(student);
+CREATE INDEX IF NOT EXISTS idx_loans_book ON loans(book_id);
+CREATE INDEX IF NOT EXISTS idx_loans_due_date ON loans(due_date);
+CREATE INDEX IF NOT EXISTS idx_loan_history_student ON loan_history(student);
+CREATE INDEX IF NOT EXISTS idx_loan_history_book ON loan_history(book_id);
+CREATE INDEX IF NOT EXISTS idx_reviews_book ON reviews(book_id);
+CREATE INDEX IF NOT EXISTS idx_holds_book ON holds(book_id);
+"""
+
+CHANGE_LOG_SIZE = 1000  # changes kept for other connections to catch up on; further behind, they reload everything
+
+SELECT_ROW = {
+    "users": "SELECT id, password, role, name, grade FROM users WHERE id = ?",
+    "books": "SELECT id, title, author, isbn, total_copies, available_copies FROM books WHERE id = ?",
+    "loans": "SELECT id, book_id, student, issue_date, due_date, fine FROM loans WHERE id = ?",
+    "reviews": "SELECT book_id, user, rating, comment FROM reviews WHERE book_id = ? AND user = ?",
+    "holds": "SELECT id, book_id, student, placed_date, expiry_date FROM holds WHERE id = ?",
+}
+RECORD_TYPES = {"users": User, "books": Book, "loans": Loan, "reviews": Review, "holds": Hold}
+
+UPSERT_USER = "INSERT OR REPLACE INTO users (id, password, role, name, grade) VALUES (?, ?, ?, ?, ?)"
+UPSERT_BOOK = ("INSERT OR REPLACE INTO books (id, title, author, isbn, total_copies, available_copies) "
+               "VALUES (?, ?, ?, ?, ?, ?)")
+UPSERT_HOLD = ("INSERT OR REPLACE INTO holds (id, book_id, student, placed_date, expiry_date) "
+               "VALUES (?, ?, ?, ?, ?)")
+UPSERT_LOAN = ("INSERT OR REPLACE INTO loans (id, book_id, student, issue_date, due_date, fine) "
+               "VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def connect(db_file=SQLITE_FILE):
+    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def create_schema(conn):
+    conn.executescript(SCHEMA)
+    # Databases migrated before students had grades
+    if "grade" not in {row[1] for row in conn.execute("PRAGMA table_info(users)")}:
+        conn.execute("ALTER TABLE users ADD COLUMN grade TEXT")
+
+
+def _user_row(user):
+    return user.user_id, user.password, user.role, user.name, user.grade
+
+
+def _book_row(book):
+    return book.book_id, book.title, book.author, book.isbn, book.total_copies, book.available_copies
+
+
+def _hold_row(hold):
+    return hold.hold_id, hold.book_id, hold.student, hold.placed_date, hold.expiry_date
+
+
+def _loan_row(loan):
+    return loan.loan_id, loan.book_id, loan.student, loan.issue_date, loan.due_date, loan.fine
+
+
+class SqliteBackend:
+    """Stores users, books and loans in orchids_library.db.
+
+    All rows are read into memory once and served from there.  Every commit
+    also lists the rows it changed in the changes table; when PRAGMA
+    data_version reports that another connection has committed, only those
+    rows are read again.
+    """
+
+    def __init__(self, db_file=SQLITE_FILE):
+        self.db_file = db_file
+        self.conn = connect(db_file)
+        create_schema(self.conn)
+        self.lock = threading.RLock()
+        self._users = None
+        self._books = None
+        self._loans = None
+        self._reviews = None
+        self._holds = None
+        self._data_version = None
+        self._change_seq = 0    # last row of the changes table applied to the cache
+        self._changes = []      # (event, changes) read from other connections' commits, see take_changes
+
+    def init_data(self):
+        """Seed the sample accounts and books into an empty database."""
+        if self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            return
+        with self.conn:
+            self.conn.executemany(UPSERT_USER, [_user_row(User.from_dict(user_id, data))
+                                                for user_id, data in default_users().items()])
+            self.conn.executemany(UPSERT_BOOK, [_book_row(Book.from_dict(book_id, data))
+                                                for book_id, data in DEFAULT_BOOKS.items()])
+
+    def _refresh(self):
+        with self.lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._users is not None and data_version == self._data_version:
+                return
+            if self._users is None or not self._apply_changes():
+                self._load()
+            self._data_version = data_version
+
+    def _load(self):
+        with span("SqliteBackend.load", "parse"):
+            self._change_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            self._users = {row[0]: User(*row) for row in self.conn.execute("SELECT id, password, role, name, grade FROM users")}
+            self._books = {row[0]: Book(*row) for row in self.conn.execute(
+                "SELECT id, title, author, isbn, total_copies, available_copies FROM books")}
+            self._loans = {row[0]: Loan(*row) for row in self.conn.execute(
+                "SELECT id, book_id, student, issue_date, due_date, fine FROM loans")}
+            reviews = (Review(*row) for row in self.conn.execute(
+                "SELECT book_id, user, rating, comment FROM reviews ORDER BY id"))
+            self._reviews = {review.key: review for review in reviews}
+            self._holds = {row[0]: Hold(*row) for row in self.conn.execute(
+                "SELECT id, book_id, student, placed_date, expiry_date FROM holds")}
+        self._changes = []
+
+    def _apply_changes(self):
+        """Read again the rows other connections changed since the last refresh; False if too far behind to."""
+        rows = self.conn.execute("SELECT seq, event, kind, key FROM changes WHERE seq > ? ORDER BY seq",
+                                 (self._change_seq,)).fetchall()
+        if not rows or rows[0][0] != self._change_seq + 1:
+            # The changes in between were pruned, or were made without being listed
+            return False
+        with span("SqliteBackend.changes", "parse"):
+            records = {"users": self._users, "books": self._books, "loans": self._loans, "reviews": self._reviews,
+                       "holds": self._holds}
+            # A row changed more than once is read once; every change to it reports the row as it is now
+            current = {}
+            for _, event, kind, key in rows:
+                if (kind, key) not in current:
+                    current[kind, key] = self._read_row(kind, key)
+                new = current[kind, key]
+                if new is None or getattr(new, "return_date", None) is not None:
+                    old = records[kind].pop(key, None)
+                else:
+                    old, records[kind][key] = records[kind].get(key), new
+                if self._changes and self._changes[-1][0] == event:
+                    self._changes[-1][1].append((kind, old, new))
+                else:
+                    self._changes.append((event, [(kind, old, new)]))
+            self._change_seq = rows[-1][0]
+        return True
+
+    def _read_row(self, kind, key):
+        """The record kind keyed key as it is now, None if it was deleted; a returned loan comes from loan_history."""
+        params = tuple(key.split(":", 1)) if kind == "reviews" else (key,)
+        row = self.conn.execute(SELECT_ROW[kind], params).fetchone()
+        if row is None and kind == "loans":
+            row = self.conn.execute("SELECT id, book_id, student, issue_date, due_date, fine, return_date "
+                                    "FROM loan_history WHERE id = ?", params).fetchone()
+        return RECORD_TYPES[kind](*row) if row is not None else None
+
+    def users(self):
+        self._refresh()
+        return self._users
+
+    def books(self):
+        self._refresh()
+        return self._books
+
+    def loans(self):
+        self._refresh()
+        return self._loans
+
+    def reviews(self):
+        self._refresh()
+        return self._reviews
+
+    def holds(self):
+        self._refresh()
+        return self._holds
+
+    def take_changes(self):
+        """Return and forget the (event, changes) pairs read from other connections' commits.
+
+        Like the JSON backend's, each change is a (kind, old record, new
+        record) tuple; a full reload replaces the collections instead.
+        """
+        with self.lock:
+            changes, self._changes = self._changes, []
+            return changes
+
+    @contextmanager
+    def transaction(self):
+        """Take the database write lock and refresh the cache, so records can be checked and changed safely.
+
+        Other connections can still read meanwhile; the store's commit ends
+        the transaction, and it is rolled back if the change is abandoned.
+        """
+        with self.lock:
+            if self.conn.in_transaction:
+                yield
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                yield
+            finally:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+
+    @traced("save")
+    def commit(self, users=(), books=(), loans=(), returned_loans=(), reviews=(), holds=(), removed_holds=(),
+               event="changed"):
+        """Write only the changed rows, all in one transaction, and list them in the changes table.
+
+        Returned loans are moved from loans to loan_history.  Called inside
+        transaction(), so the cache has already caught up with every earlier
+        change.
+        """
+        changed = ([(event, "users", user.user_id) for user in users]
+                   + [(event, "books", book.book_id) for book in books]
+                   + [(event, "loans", loan.loan_id) for loan in itertools.chain(loans, returned_loans)]
+                   + [(event, "reviews", review.key) for review in reviews]
+                   + [(event, "holds", hold.hold_id) for hold in itertools.chain(removed_holds, holds)])
+        try:
+            with self.lock, self.conn:
+                if users:
+                    self.conn.executemany(UPSERT_USER, [_user_row(user) for user in users])
+                if books:
+                    self.conn.executemany(UPSERT_BOOK, [_book_row(book) for book in books])
+                if loans:
+                    self.conn.executemany(UPSERT_LOAN, [_loan_row(loan) for loan in loans])
+                if returned_loans:
+                    self.conn.executemany("DELETE FROM loans WHERE id = ?",
+                                          [(loan.loan_id,) for loan in returned_loans])
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO loan_history "
+                        "(id, book_id, student, issue_date, due_date, fine, return_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [_loan_row(loan) + (loan.return_date,) for loan in returned_loans])
+                if reviews:
+                    # A student's new review of a book replaces their old one
+                    self.conn.executemany("DELETE FROM reviews WHERE book_id = ? AND user = ?",
+                                          [(review.book_id, review.user) for review in reviews])
+                    self.conn.executemany("INSERT INTO reviews (book_id, user, rating, comment) VALUES (?, ?, ?, ?)",
+                                          [(review.book_id, review.user, review.rating, review.comment)
+                                           for review in reviews])
+                if removed_holds:
+                    self.conn.executemany("DELETE FROM holds WHERE id = ?", [(hold.hold_id,) for hold in removed_holds])
+                if holds:
+                    self.conn.executemany(UPSERT_HOLD, [_hold_row(hold) for hold in holds])
+                if changed:
+                    self.conn.executemany("INSERT INTO changes (event, kind, key) VALUES (?, ?, ?)", changed)
+                    self._change_seq = self.conn.execute("SELECT MAX(seq) FROM changes").fetchone()[0]
+                    self.conn.execute("DELETE FROM changes WHERE seq <= ?", (self._change_seq - CHANGE_LOG_SIZE,))
+        except sqlite3.Error as e:
+            # The cached records were changed before the write failed; reload them.
+            self._users = None
+            if isinstance(e, sqlite3.IntegrityError):
+                # Report it the way the JSON backend's checks would
+                raise LibraryError(f"The change refers to a user or book that does not exist ({e}).") from e
+            raise
+
+    def last_loan_id(self):
+        """The highest loan ID used so far, counting returned loans, so IDs are never handed out twice."""
+        with self.lock:
+            return self.conn.execute("SELECT MAX(id) FROM (SELECT MAX(CAST(id AS INTEGER)) AS id FROM loans "
+                                     "UNION ALL SELECT MAX(CAST(id AS INTEGER)) FROM loan_history)").fetchone()[0] or 0
+
+    def has_returned(self, student_id, book_id):
+        """True if the student has borrowed and returned a copy of the book before."""
+        with self.lock:
+            return self.conn.execute("SELECT 1 FROM loan_history WHERE student = ? AND book_id = ? LIMIT 1",
+                                     (student_id, book_id)).fetchone() is not None
+
+    def loan_history(self):
+        """Every returned loan, in the order they were returned."""
+        rows = self.conn.execute("SELECT id, book_id, student, issue_date, due_date, fine, return_date "
+                                 "FROM loan_history ORDER BY return_date, rowid")
+        return [Loan(*row) for row in rows]
+
+    @traced("parse")
+    def loan_archive(self):
+        """Every returned loan as a LoanColumns, its dates converted to ordinals by SQLite."""
+        columns = LoanColumns()
+        # julianday('0001-01-01') is 1721425.5 and date.toordinal() of that day is 1
+        rows = self.conn.execute(
+            "SELECT book_id, student, CAST(julianday(issue_date) - 1721424.5 AS INTEGER), "
+            "CAST(julianday(due_date) - 1721424.5 AS INTEGER), CAST(julianday(return_date) - 1721424.5 AS INTEGER), "
+            "fine FROM loan_history ORDER BY return_date, rowid")
+        for row in rows:
+            columns.append(*row)
+        return columns
+
+    def close(self):
+        self.conn.close()
+
+
+def migrate_json_to_sqlite(db_file=SQLITE_FILE, users_file="users.json", books_file="books.json",
+                           borrowed_file="borrowed_books.json", reviews_file="reviews.json", holds_file="holds.json"):
+    """Copy every record from the JSON files into the SQLite database.
+
+    Existing rows with the same IDs are replaced, so running the migration
+    twice is harmless.  Returns the number of rows written per table.
+    """
+    source = JsonBackend(users_file, books_file, borrowed_file, reviews_file, holds_file)
+    users = source.users().values()
+    books = source.books().values()
+    loans = source.loans().values()
+    history = source.loan_history()
+    reviews = [(review.book_id, review.user, review.rating, review.comment) for review in source.reviews().values()]
+    holds = source.holds().values()
+
+    conn = connect(db_file)
+    try:
+        create_schema(conn)
+        with conn:
+            conn.executemany(UPSERT_USER, [_user_row(user) for user in users])
+            conn.executemany(UPSERT_BOOK, [_book_row(book) for book in books])
+            conn.executemany(UPSERT_LOAN, [_loan_row(loan) for loan in loans])
+            conn.executemany("INSERT OR REPLACE INTO loan_history "
+                             "(id, book_id, student, issue_date, due_date, fine, return_date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             [_loan_row(loan) + (loan.return_date,) for loan in history])
+            conn.execute("DELETE FROM reviews")
+            conn.executemany("INSERT INTO reviews (book_id, user, rating, comment) VALUES (?, ?, ?, ?)", reviews)
+            conn.executemany(UPSERT_HOLD, [_hold_row(hold) for hold in holds])
+    finally:
+        conn.close()
+
+    return {"users": len(users), "books": len(books), "loans": len(loans), "history": len(history),
+            "reviews": len(reviews), "holds": len(holds)}
+
+
+if __name__ == "__main__":
+    db_file = sys.argv[1] if len(sys.argv) > 1 else SQLITE_FILE
+    counts = migrate_json_to_sqlite(db_file)
+    print(f"Migrated {counts['users']} users, {counts['books']} books, {counts['loans']} loans, "
+          f"{counts['history']} returned loans, {counts['reviews']} reviews and {counts['holds']} holds "
+          f"into {db_file}")
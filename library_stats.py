@@ -0,0 +1,68 @@
+"""Observable library statistics for the admin dashboard.
+
+LibraryStats tells its observers when the "books issued" or "books overdue"
+counters change, so the dashboard cards can be refreshed without rereading
+the loans or searching the widget tree for the labels to change.  Both
+counters are read from the store's indexes in O(log n), and the overdue count
+rolls over at midnight without rescanning the loans.
+"""
+from datetime import datetime, timedelta
+
+
+def ms_until_midnight(now=None):
+    """Milliseconds from now until just after the coming midnight."""
+    now = now or datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return int((midnight - now).total_seconds() * 1000) + 1000
+
+
+class LibraryStats:
+    def __init__(self, store):
+        self.store = store
+        self._observers = []
+        self._loans = None  # the loans collection last reported, read lazily so creating this does no I/O
+        store.subscribe(self._on_store_event)
+
+    @property
+    def total_issued(self):
+        return len(self.store.loans)
+
+    @property
+    def overdue_count(self):
+        return self.store.due_index.overdue_count()
+
+    def bind(self, observer):
+        """Call observer(stats) now and whenever the counters change."""
+        if observer not in self._observers:
+            self._observers.append(observer)
+        observer(self)
+
+    def unbind(self, observer):
+        if observer in self._observers:
+            self._observers.remove(observer)
+
+    def _changed(self):
+        for observer in list(self._observers):
+            observer(self)
+
+    def refresh(self):
+        """Notify observers if another program changed the loans on disk."""
+        if self.store.loans is not self._loans:
+            self._loans = self.store.loans
+            self._changed()
+
+    def schedule_rollover(self, after):
+        """Notify observers at every midnight, when loans due today become overdue.
+
+        after(milliseconds, callback) schedules a call, e.g. Tk's root.after.
+        """
+        def rollover():
+            self._changed()
+            self.schedule_rollover(after)
+
+        after(ms_until_midnight(), rollover)
+
+    def _on_store_event(self, event, loan):
+        # A batch of loans is one event, so observers refresh once for the whole batch
+        if event in ("loan_issued", "loan_returned", "loans_issued", "loans_returned"):
+            self._changed()
@@ -0,0 +1,1514 @@
+"""Headless data layer for the Orchids library app.
+
+LibraryStore loads users.json, books.json, borrowed_books.json,
+reviews.json and holds.json once, keeps them as typed in-memory records and
+only parses a file again when its modification time or size changes on
+disk.  The GUI, and any future CLI or service, should read and change
+library data through this class rather than opening the JSON files
+themselves.
+
+Persistence is delegated to a backend: JsonBackend (the default) keeps the
+original JSON files, while library_sqlite.SqliteBackend stores the same
+records in orchids_library.db.  Use open_store() to pick whichever one holds
+the library data.
+
+JsonBackend never rewrites a data file in place.  Each change is appended and
+fsynced to library_events.jsonl as one numbered event ("loan_issued",
+"loan_returned", "loan_fined", ...) carrying the new state of the records it
+touched.  On load the events after the last compaction are replayed on top of
+the JSON snapshots.  A background compaction periodically folds the events
+into the snapshots, moves returned loans into loan_history.jsonl and empties
+the log, so startup only ever replays a short tail.
+
+Several programs may share the same files (for example librarian PCs using a
+network share).  Every change is made inside a backend transaction, which
+takes the library.lock file lock, first replays whatever the other programs
+appended to the log since this one last looked, and only then checks and
+changes the records.  The lock is held for one appended line, never for a
+whole-file rewrite, so a burst of issues at the start of term cannot
+oversell a book or hand out the same loan ID twice.
+"""
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from library_analytics import ARCHIVE_DIR, LoanArchive, LoanColumns, loan_report
+from library_auth import LoginThrottle, hash_password, is_hashed, needs_rehash, verify_password, waste_verification
+from library_holds import HOLD_DAYS, HoldQueues
+from library_loans import DueDateIndex, LoanIndex
+from library_recommend import CoBorrowIndex
+from library_reviews import RatingIndex
+from library_lock import FileLock
+from library_search import CatalogIndex, StudentIndex
+from library_trace import span, traced
+
+DATE_FORMAT = "%Y-%m-%d"
+FINE_AMOUNT = 5
+SQLITE_FILE = "orchids_library.db"
+EVENT_LOG_FILE = "library_events.jsonl"
+HISTORY_FILE = "loan_history.jsonl"
+CHECKPOINT_FILE = "library_checkpoint.json"
+RECOMMENDATIONS_FILE = "recommendations.json"
+LOCK_FILE = "library.lock"
+COMPACTION_LOCK_FILE = "library_compaction.lock"
+# Number of logged events after which a background compaction is started.
+COMPACT_EVERY = 200
+# Seconds for which reads outside a transaction trust the cached records without looking at the files again.
+STAT_INTERVAL = 0.1
+# What LibraryStore.load() reads and builds, users first as logging in needs nothing else.
+LOAD_ORDER = ("users", "books", "loans", "reviews", "holds", "catalog", "student_index", "due_index", "loan_index",
+              "rating_index", "hold_queues", "recommendation_index")
+
+DEFAULT_USERS = {
+    "admin": {"password": "admin123", "role": "admin", "name": "Administrator"},
+    "student1": {"password": "pass123", "role": "student", "name": "John Doe"},
+    "student2": {"password": "pass456", "role": "student", "name": "Jane Smith"}
+}
+
+DEFAULT_BOOKS = {
+    "1": {"title": "Python Programming", "author": "John Smith", "isbn": "978-0123456789",
+          "total_copies": 3, "available_copies": 3},
+    "2": {"title": "Data Science Basics", "author": "Mary Johnson", "isbn": "978-0987654321",
+          "total_copies": 2, "available_copies": 2},
+    "3": {"title": "Machine Learning", "author": "Bob Wilson", "isbn": "978-0456789123",
+          "total_copies": 4, "available_copies": 4}
+}
+
+
+def default_users():
+    """DEFAULT_USERS with their passwords hashed, for seeding a new library."""
+    return {user_id: {**data, "password": hash_password(data["password"])} for user_id, data in DEFAULT_USERS.items()}
+
+
+class LibraryError(Exception):
+    """Raised when a library operation cannot be carried out."""
+
+
+class _Record:
+    """Base for the record classes, which keep their attributes in __slots__ instead of a dict per record."""
+    __slots__ = ()
+    _fields = ()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in self._fields)})"
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    __hash__ = None
+
+    @classmethod
+    def records_from_json(cls, data):
+        """Records keyed by ID from the contents of their snapshot file."""
+        return {key: cls.from_dict(key, value) for key, value in data.items()}
+
+    @staticmethod
+    def records_to_json(records):
+        return {key: record.to_dict() for key, record in records.items()}
+
+
+# Every loan due on the same day shares one date string and one ordinal int.
+_DATE_ORDINALS = {}  # "YYYY-MM-DD" -> date ordinal
+_ORDINAL_DATES = {}  # date ordinal -> "YYYY-MM-DD"
+
+
+def date_ordinal(text):
+    """Parse a DATE_FORMAT date into its ordinal day number."""
+    ordinal = _DATE_ORDINALS.get(text)
+    if ordinal is None:
+        ordinal = _DATE_ORDINALS[text] = datetime.strptime(text, DATE_FORMAT).toordinal()
+    return ordinal
+
+
+def ordinal_date(ordinal):
+    """Format a date ordinal as DATE_FORMAT text."""
+    text = _ORDINAL_DATES.get(ordinal)
+    if text is None:
+        text = _ORDINAL_DATES[ordinal] = date.fromordinal(ordinal).strftime(DATE_FORMAT)
+    return text
+
+
+class User(_Record):
+    """A login account; students may have a grade (class or year group), used to group borrowing reports."""
+    __slots__ = ("user_id", "password", "_role", "name", "grade")
+    _fields = ("user_id", "password", "role", "name", "grade")
+
+    def __init__(self, user_id, password, role, name, grade=None):
+        self.user_id = user_id
+        self.password = password
+        self.role = role
+        self.name = name
+        self.grade = grade
+
+    @property
+    def role(self):
+        return self._role
+
+    @role.setter
+    def role(self, role):
+        self._role = sys.intern(role)
+
+    @property
+    def is_admin(self):
+        return self.role == "admin"
+
+    @property
+    def is_student(self):
+        return self.role == "student"
+
+    @classmethod
+    def from_dict(cls, user_id, data):
+        grade = data.get("grade")
+        return cls(user_id, data.get("password", ""), data.get("role", "student"), data.get("name", user_id),
+                   str(grade) if grade is not None else None)
+
+    def to_dict(self):
+        data = {"password": self.password, "role": self.role, "name": self.name}
+        if self.grade is not None:
+            data["grade"] = self.grade
+        return data
+
+
+class Book(_Record):
+    __slots__ = ("book_id", "title", "_author", "isbn", "total_copies", "available_copies")
+    _fields = ("book_id", "title", "author", "isbn", "total_copies", "available_copies")
+
+    def __init__(self, book_id, title, author, isbn, total_copies, available_copies):
+        self.book_id = book_id
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.total_copies = total_copies
+        self.available_copies = available_copies
+
+    @property
+    def author(self):
+        return self._author
+
+    @author.setter
+    def author(self, author):
+        # Authors repeat across many books, so each name is stored once.
+        self._author = sys.intern(author)
+
+    @classmethod
+    def from_dict(cls, book_id, data):
+        return cls(book_id, data["title"], data["author"], data["isbn"],
+                   int(data["total_copies"]), int(data["available_copies"]))
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "author": self.author,
+            "isbn": self.isbn,
+            "total_copies": self.total_copies,
+            "available_copies": self.available_copies
+        }
+
+
+class Loan(_Record):
+    """A loan; its dates are kept as ordinal day numbers and read or set as DATE_FORMAT text."""
+    __slots__ = ("loan_id", "_book_id", "_student", "issue_ordinal", "due_ordinal", "fine", "return_ordinal")
+    _fields = ("loan_id", "book_id", "student", "issue_date", "due_date", "fine", "return_date")
+
+    def __init__(self, loan_id, book_id, student, issue_date, due_date, fine=0, return_date=None):
+        self.loan_id = loan_id
+        self.book_id = book_id
+        self.student = student
+        self.issue_date = issue_date
+        self.due_date = due_date
+        self.fine = fine
+        self.return_date = return_date
+
+    # Book and student IDs repeat across loans, so each is stored once.
+
+    @property
+    def book_id(self):
+        return self._book_id
+
+    @book_id.setter
+    def book_id(self, book_id):
+        self._book_id = sys.intern(book_id)
+
+    @property
+    def student(self):
+        return self._student
+
+    @student.setter
+    def student(self, student):
+        self._student = sys.intern(student)
+
+    @property
+    def issue_date(self):
+        return ordinal_date(self.issue_ordinal)
+
+    @issue_date.setter
+    def issue_date(self, text):
+        self.issue_ordinal = date_ordinal(text)
+
+    @property
+    def due_date(self):
+        return ordinal_date(self.due_ordinal)
+
+    @due_date.setter
+    def due_date(self, text):
+        self.due_ordinal = date_ordinal(text)
+
+    @property
+    def return_date(self):
+        return ordinal_date(self.return_ordinal) if self.return_ordinal is not None else None
+
+    @return_date.setter
+    def return_date(self, text):
+        self.return_ordinal = date_ordinal(text) if text is not None else None
+
+    def is_overdue(self, today=None):
+        """True from the start of the due date onwards."""
+        return self.due_ordinal <= (today or date.today()).toordinal()
+
+    @classmethod
+    def from_dict(cls, loan_id, data):
+        return cls(loan_id, data["book_id"], data["student"], data["issue_date"], data["due_date"],
+                   data.get("fine", 0), data.get("return_date"))
+
+    def to_dict(self):
+        data = {
+            "book_id": self.book_id,
+            "student": self.student,
+            "issue_date": self.issue_date,
+            "due_date": self.due_date,
+            "fine": self.fine
+        }
+        if self.return_ordinal is not None:
+            data["return_date"] = self.return_date
+        return data
+
+
+class Hold(_Record):
+    """A student's place in the queue for a book; once a copy is kept for them it expires after expiry_date."""
+    __slots__ = ("hold_id", "book_id", "student", "placed_ordinal", "expiry_ordinal")
+    _fields = ("hold_id", "book_id", "student", "placed_date", "expiry_date")
+
+    def __init__(self, hold_id, book_id, student, placed_date, expiry_date=None):
+        self.hold_id = hold_id
+        self.book_id = book_id
+        self.student = student
+        self.placed_date = placed_date
+        self.expiry_date = expiry_date
+
+    @property
+    def placed_date(self):
+        return ordinal_date(self.placed_ordinal)
+
+    @placed_date.setter
+    def placed_date(self, text):
+        self.placed_ordinal = date_ordinal(text)
+
+    @property
+    def expiry_date(self):
+        return ordinal_date(self.expiry_ordinal) if self.expiry_ordinal is not None else None
+
+    @expiry_date.setter
+    def expiry_date(self, text):
+        self.expiry_ordinal = date_ordinal(text) if text is not None else None
+
+    @property
+    def is_ready(self):
+        """True once a copy is being kept for the student to pick up."""
+        return self.expiry_ordinal is not None
+
+    @classmethod
+    def from_dict(cls, hold_id, data):
+        return cls(hold_id, data["book_id"], data["student"], data["placed_date"], data.get("expiry_date"))
+
+    def to_dict(self):
+        data = {"book_id": self.book_id, "student": self.student, "placed_date": self.placed_date}
+        if self.expiry_ordinal is not None:
+            data["expiry_date"] = self.expiry_date
+        return data
+
+
+def review_key(book_id, user_id):
+    return f"{book_id}:{user_id}"
+
+
+class Review(_Record):
+    """A student's 1-5 star rating of a book; each student has at most one review per book."""
+    __slots__ = ("book_id", "user", "rating", "comment")
+    _fields = ("book_id", "user", "rating", "comment")
+
+    def __init__(self, book_id, user, rating, comment=""):
+        self.book_id = book_id
+        self.user = user
+        self.rating = rating
+        self.comment = comment
+
+    @property
+    def key(self):
+        return review_key(self.book_id, self.user)
+
+    @classmethod
+    def from_dict(cls, key, data):
+        return cls(data["book_id"], data["user"], int(data["rating"]), data.get("comment", ""))
+
+    def to_dict(self):
+        return {"book_id": self.book_id, "user": self.user, "rating": self.rating, "comment": self.comment}
+
+    # reviews.json lists the reviews of each book: {book_id: [{"user", "rating", "comment"}, ...]}
+
+    @classmethod
+    def records_from_json(cls, data):
+        return {review_key(book_id, review["user"]): cls(book_id, review["user"], int(review["rating"]),
+                                                         review.get("comment", ""))
+                for book_id, reviews in data.items() for review in reviews}
+
+    @staticmethod
+    def records_to_json(records):
+        data = {}
+        for review in records.values():
+            data.setdefault(review.book_id, []).append(
+                {"user": review.user, "rating": review.rating, "comment": review.comment})
+        return data
+
+
+# Event key -> the collection (and snapshot file) it changes.
+_EVENT_KINDS = {"users": "users", "books": "books", "loans": "loans", "returned_loans": "loans", "reviews": "reviews",
+                "holds": "holds", "removed_holds": "holds"}
+
+
+def atomic_write_json(path, data, compact=False):
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file.
+
+    compact leaves out the indentation, for large files only programs read.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        if compact:
+            # dumps without indentation runs in C; dump streams through the Python encoder
+            f.write(json.dumps(data, separators=(",", ":")))
+        else:
+            json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@traced("parse")
+def _read_snapshot(path, record_type):
+    try:
+        with open(path, 'r') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        raise LibraryError(f"{path} is corrupted; restore it from a backup before starting the library.")
+    return record_type.records_from_json(raw)
+
+
+@traced("parse")
+def _read_jsonl(path, offset=0):
+    """Return the complete lines of a JSONL file from offset on, and the offset just past them.
+
+    A last line without a newline is either being appended by another program
+    or was torn by a crash mid-append; it is left for a later read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    end = data.rfind(b"\n") + 1
+    return [json.loads(line) for line in data[:end].splitlines() if line.strip()], offset + end
+
+
+class JsonBackend:
+    """Stores users, books and loans as JSON snapshots plus an append-only event log."""
+
+    def __init__(self, users_file="users.json", books_file="books.json", borrowed_file="borrowed_books.json",
+                 reviews_file="reviews.json", holds_file="holds.json", event_log_file=EVENT_LOG_FILE, history_file=HISTORY_FILE, checkpoint_file=CHECKPOINT_FILE,
+                 lock_file=LOCK_FILE, compaction_lock_file=COMPACTION_LOCK_FILE, compact_every=COMPACT_EVERY,
+                 archive_dir=ARCHIVE_DIR, stat_interval=STAT_INTERVAL):
+        self.users_file = users_file
+        self.books_file = books_file
+        self.borrowed_file = borrowed_file
+        self.reviews_file = reviews_file
+        self.holds_file = holds_file
+        self.event_log_file = event_log_file
+        self.history_file = history_file
+        self.checkpoint_file = checkpoint_file
+        self.compact_every = compact_every
+        self.stat_interval = stat_interval
+        self.archive = LoanArchive(archive_dir)
+        self.lock = threading.RLock()
+        self._file_lock = FileLock(lock_file)
+        self._compaction_lock = FileLock(compaction_lock_file)
+
+        self._snapshots = {"users": (users_file, User), "books": (books_file, Book), "loans": (borrowed_file, Loan),
+                           "reviews": (reviews_file, Review), "holds": (holds_file, Hold)}
+        self._records = None
+        self._signature = None
+        self._checked_at = 0.0  # time.monotonic() of the last look at the files
+        self._seq = 0           # number of the last logged event
+        self._tail = 0          # events logged since the last compaction
+        self._log_offset = 0    # bytes of the event log replayed so far
+        self._dirty = set()     # collections whose snapshot is behind the log
+        self._last_loan_id = 0  # highest loan ID ever used, current or returned
+        self._changes = []      # (event, changes) replayed from other programs, see take_changes
+        self._compactor = None
+
+    def init_data(self):
+        """Create the data files with sample content if they do not exist yet."""
+        with self.lock, self._file_lock:
+            if not os.path.exists(self.users_file):
+                atomic_write_json(self.users_file, default_users())
+
+            if not os.path.exists(self.books_file):
+                atomic_write_json(self.books_file, DEFAULT_BOOKS)
+
+            if not os.path.exists(self.borrowed_file):
+                atomic_write_json(self.borrowed_file, {})
+
+    def _stat(self):
+        signature = []
+        for path in (self.users_file, self.books_file, self.borrowed_file, self.event_log_file, self.checkpoint_file,
+                     self.reviews_file, self.holds_file):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _checkpoint(self):
+        """The checkpoint: the last compacted event and the highest loan ID up to it."""
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"seq": 0, "last_loan_id": 0}
+
+    def _compacted_seq(self):
+        return self._checkpoint()["seq"]
+
+    @staticmethod
+    def _event_loan_id(event):
+        """Highest loan ID issued or returned by an event, 0 if it has none."""
+        return max((int(loan_id) for key in ("loans", "returned_loans") for loan_id in event.get(key, ())),
+                   default=0)
+
+    def _log_only_grew(self, signature):
+        """True if the snapshots are untouched and the log was only appended to since the last read."""
+        old = self._signature
+        if signature[:3] != old[:3] or signature[4:] != old[4:] or signature[3] is None:
+            return False
+        return old[3] is None or (signature[3][2] == old[3][2] and signature[3][1] >= self._log_offset)
+
+    def _current(self, fresh=False):
+        """The cached records, brought up to date with any changes made on disk.
+
+        Events other programs appended are replayed onto the cached records;
+        anything else (such as another program's compaction) reloads them.
+        Unless fresh is set, the files are not looked at again within
+        stat_interval seconds of the last look, so reading records row by row
+        does not stat every data file for every row.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not fresh and self._records is not None and now - self._checked_at < self.stat_interval:
+                return self._records
+            self._checked_at = now
+            signature = self._stat()
+            if self._records is not None and signature != self._signature and self._log_only_grew(signature):
+                events, self._log_offset = _read_jsonl(self.event_log_file, self._log_offset)
+                for event in events:
+                    if event["seq"] > self._seq:
+                        self._changes.append((event["event"], self._replay(self._records, event)))
+                        self._seq = event["seq"]
+                        self._last_loan_id = max(self._last_loan_id, self._event_loan_id(event))
+                        self._tail += 1
+                        self._dirty.update(_EVENT_KINDS[key] for key in event if key in _EVENT_KINDS)
+                self._signature = signature
+            elif self._records is None or signature != self._signature:
+                records = {kind: _read_snapshot(path, record_type)
+                           for kind, (path, record_type) in self._snapshots.items()}
+                checkpoint = self._checkpoint()
+                compacted_seq = checkpoint["seq"]
+                events, self._log_offset = _read_jsonl(self.event_log_file)
+                tail = [event for event in events if event["seq"] > compacted_seq]
+                for event in tail:
+                    self._replay(records, event)
+                if "last_loan_id" not in checkpoint:
+                    # Written before checkpoints kept it; the next compaction will
+                    checkpoint["last_loan_id"] = max((int(loan.loan_id) for _, loan in self._history_entries()),
+                                                     default=0)
+                self._last_loan_id = max([checkpoint["last_loan_id"]] + [int(loan_id) for loan_id in records["loans"]]
+                                         + [self._event_loan_id(event) for event in tail])
+                self._records = records
+                self._changes = []
+                self._seq = max([compacted_seq] + [event["seq"] for event in events])
+                self._tail = len(tail)
+                self._dirty = {_EVENT_KINDS[key] for event in tail for key in event if key in _EVENT_KINDS}
+                self._signature = signature
+            return self._records
+
+    @staticmethod
+    def _replay(records, event):
+        """Apply one event and return its changes as (kind, old record, new record) tuples.
+
+        Events carry whole records, so replaying one twice is harmless.  A
+        returned loan's new record has its return_date set and is no longer
+        among the current loans; a removed hold has no new record.
+        """
+        changes = []
+        for kind, record_type in (("users", User), ("books", Book), ("loans", Loan), ("reviews", Review),
+                                  ("holds", Hold)):
+            for key, value in event.get(kind, {}).items():
+                new = record_type.from_dict(key, value)
+                changes.append((kind, records[kind].get(key), new))
+                records[kind][key] = new
+        for loan_id, value in event.get("returned_loans", {}).items():
+            changes.append(("loans", records["loans"].pop(loan_id, None), Loan.from_dict(loan_id, value)))
+        for hold_id in event.get("removed_holds", ()):
+            changes.append(("holds", records["holds"].pop(hold_id, None), None))
+        return changes
+
+    def take_changes(self):
+        """Return and forget the (event, changes) pairs replayed from other programs' appends.
+
+        Only changes applied to the cached records in place are reported; a
+        full reload replaces the collections instead.
+        """
+        with self.lock:
+            changes, self._changes = self._changes, []
+            return changes
+
+    @contextmanager
+    def transaction(self):
+        """Hold the library lock and bring the records up to date, so they can be checked and changed safely."""
+        with self.lock, self._file_lock:
+            self._current(fresh=True)
+            yield
+
+    def users(self):
+        return self._current()["users"]
+
+    def books(self):
+        return self._current()["books"]
+
+    def loans(self):
+        return self._current()["loans"]
+
+    def reviews(self):
+        return self._current()["reviews"]
+
+    def holds(self):
+        return self._current()["holds"]
+
+    @traced("save")
+    def commit(self, users=(), books=(), loans=(), returned_loans=(), reviews=(), holds=(), removed_holds=(),
+               event="changed"):
+        """Durably record changed records as one appended event.
+
+        The records have already been updated in the cached collections; the
+        JSON snapshots catch up at the next compaction.
+        """
+        with self.transaction():
+            entry = {"seq": self._seq + 1, "event": event}
+            if users:
+                entry["users"] = {user.user_id: user.to_dict() for user in users}
+            if books:
+                entry["books"] = {book.book_id: book.to_dict() for book in books}
+            if loans:
+                entry["loans"] = {loan.loan_id: loan.to_dict() for loan in loans}
+            if returned_loans:
+                entry["returned_loans"] = {loan.loan_id: loan.to_dict() for loan in returned_loans}
+            if reviews:
+                entry["reviews"] = {review.key: review.to_dict() for review in reviews}
+            if holds:
+                entry["holds"] = {hold.hold_id: hold.to_dict() for hold in holds}
+            if removed_holds:
+                entry["removed_holds"] = [hold.hold_id for hold in removed_holds]
+            line = (json.dumps(entry) + "\n").encode("utf-8")
+
+            with open(self.event_log_file, 'ab') as f:
+                # Nobody else can be appending now, so an unfinished last line was torn by a crash.
+                if f.tell() > self._log_offset:
+                    f.truncate(self._log_offset)
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._seq += 1
+            self._tail += 1
+            self._log_offset += len(line)
+            self._last_loan_id = max(self._last_loan_id, self._event_loan_id(entry))
+            self._dirty.update(_EVENT_KINDS[key] for key in entry if key in _EVENT_KINDS)
+            self._signature = self._stat()
+
+            if self._tail >= self.compact_every:
+                self.compact_in_background()
+
+    def compact(self):
+        """Fold the logged events into the JSON snapshots and archive the returned loans.
+
+        Only one program compacts at a time; if another one is already at it,
+        this returns straight away.
+        """
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        try:
+            self._compact()
+        finally:
+            self._compaction_lock.release()
+
+    @traced("save")
+    def _compact(self):
+        with self.transaction():
+            if self._records is None or not self._tail:
+                return
+            seq = self._seq
+            last_loan_id = self._last_loan_id
+            snapshots = {kind: self._snapshots[kind][1].records_to_json(self._records[kind]) for kind in self._dirty}
+            compacted_seq = self._compacted_seq()
+            returned = [event for event in _read_jsonl(self.event_log_file)[0]
+                        if compacted_seq < event["seq"] <= seq and "returned_loans" in event]
+
+        # The slow file writes happen without holding the locks, so commits can carry on.
+        # A crash anywhere here leaves the log intact; the history reader skips
+        # entries archived twice because their sequence numbers repeat.
+        if returned:
+            with open(self.history_file, 'a') as f:
+                for event in returned:
+                    for loan_id, loan in event["returned_loans"].items():
+                        f.write(json.dumps({"seq": event["seq"], "loan_id": loan_id, **loan}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        archived_seq = self.archive.seq
+        if archived_seq < compacted_seq:
+            # The archive is new, or was lost: rebuild it from the history just written
+            self.archive.rebuild([loan for _, loan in self._history_entries()], seq)
+        else:
+            self.archive.append(self._returned_after(returned, archived_seq), seq)
+        for kind, data in snapshots.items():
+            atomic_write_json(self._snapshots[kind][0], data)
+        atomic_write_json(self.checkpoint_file, {"seq": seq, "last_loan_id": last_loan_id})
+
+        with self.transaction():
+            # The transaction replayed anything appended meanwhile, so the
+            # events kept below have all been applied to the cached records.
+            remaining = [event for event in _read_jsonl(self.event_log_file)[0] if event["seq"] > seq]
+            data = "".join(json.dumps(event) + "\n" for event in remaining).encode("utf-8")
+            tmp_path = self.event_log_file + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.event_log_file)
+            self._tail = len(remaining)
+            self._log_offset = len(data)
+            self._dirty = {_EVENT_KINDS[key] for event in remaining for key in event if key in _EVENT_KINDS}
+            self._signature = self._stat()
+
+    def compact_in_background(self):
+        if self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self.compact, name="library-compaction", daemon=True)
+            self._compactor.start()
+
+    def _history_entries(self):
+        """(event number, loan) of every returned loan in loan_history.jsonl, skipping entries archived twice."""
+        entries = []
+        last_seq, last_seq_loans = 0, set()
+        for entry in _read_jsonl(self.history_file)[0]:
+            seq, loan_id = entry["seq"], entry["loan_id"]
+            if seq > last_seq:
+                last_seq, last_seq_loans = seq, set()
+            elif seq < last_seq or loan_id in last_seq_loans:
+                continue
+            last_seq_loans.add(loan_id)
+            entries.append((seq, Loan.from_dict(loan_id, entry)))
+        return entries
+
+    @staticmethod
+    def _returned_after(events, seq):
+        return [Loan.from_dict(loan_id, loan) for event in events if event["seq"] > seq
+                for loan_id, loan in event.get("returned_loans", {}).items()]
+
+    def last_loan_id(self):
+        """The highest loan ID used so far, counting returned loans, so IDs are never handed out twice."""
+        with self.lock:
+            self._current()
+            return self._last_loan_id
+
+    def has_returned(self, student_id, book_id):
+        """True if the student has borrowed and returned a copy of the book before."""
+        columns = self.loan_archive()
+        if student_id not in columns.student_ids or book_id not in columns.book_ids:
+            return False
+        student, book = columns.student_ids.index(student_id), columns.book_ids.index(book_id)
+        return any(s == student and b == book for s, b in zip(columns.student, columns.book))
+
+    def loan_history(self):
+        """Every returned loan, in the order they were returned."""
+        entries = self._history_entries()
+        last_seq = entries[-1][0] if entries else 0
+        return [loan for _, loan in entries] + self._returned_after(_read_jsonl(self.event_log_file)[0], last_seq)
+
+    @traced("parse")
+    def loan_archive(self):
+        """Every returned loan as a LoanColumns, read from the columnar archive plus the event log."""
+        # The log is read first: a compaction finishing in between only moves events into the archive.
+        events = _read_jsonl(self.event_log_file)[0]
+        seq = self.archive.seq
+        if seq < self._compacted_seq():
+            # Not archived yet; the next compaction will
+            columns = LoanColumns()
+            columns.extend(self.loan_history())
+            return columns
+        columns = self.archive.read()
+        columns.extend(self._returned_after(events, seq))
+        return columns
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        self.compact()
+
+
+class LibraryStore:
+    def __init__(self, backend=None, recommendations_file=RECOMMENDATIONS_FILE):
+        self.backend = backend or JsonBackend()
+        self.recommendations_file = recommendations_file
+        self._indexes = {}  # name -> (collection the index was built from, index)
+        self._listeners = []
+        self.login_throttle = LoginThrottle()
+
+    def init_data(self):
+        self.backend.init_data()
+
+    def load(self, names=LOAD_ORDER):
+        """Read the data files and build the indexes now rather than on first use.
+
+        names picks the collections and indexes to load, from LOAD_ORDER.
+        """
+        # Reading each property loads its collection or builds its index.
+        for name in names:
+            getattr(self, name)
+
+    def subscribe(self, listener):
+        """Call listener(event, record) after every change made through this store.
+
+        Events are "book_added", "book_updated", "loan_issued", "loan_returned",
+        "loan_fined", "review_added", "hold_placed", "hold_ready" (a copy is
+        now kept for the hold), "hold_cancelled" and "hold_expired"; record is
+        the Book, Loan, Review or Hold that changed.  Batches of loans are
+        reported once, as "loans_issued" or "loans_returned" with the list of
+        Loans as record.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.remove(listener)
+
+    def _notify(self, event, record):
+        for listener in list(self._listeners):
+            listener(event, record)
+
+    def _commit(self, event, record, **changes):
+        """Persist the changed records under the event's name, then tell the listeners."""
+        self.backend.commit(event=event, **changes)
+        self._notify(event, record)
+
+    def close(self):
+        self.backend.close()
+
+    # Collections
+
+    @property
+    def users(self):
+        users = self.backend.users()
+        self._sync()
+        return users
+
+    @property
+    def books(self):
+        books = self.backend.books()
+        self._sync()
+        return books
+
+    @property
+    def loans(self):
+        loans = self.backend.loans()
+        self._sync()
+        return loans
+
+    @property
+    def reviews(self):
+        """Reviews keyed by review_key(book ID, student ID)."""
+        reviews = self.backend.reviews()
+        self._sync()
+        return reviews
+
+    @property
+    def holds(self):
+        """Holds keyed by hold ID."""
+        holds = self.backend.holds()
+        self._sync()
+        return holds
+
+    def _sync(self):
+        """Apply changes other programs made to the shared records to the indexes, then tell the listeners."""
+        for event, changes in self.backend.take_changes():
+            for kind, old, new in changes:
+                if kind == "users":
+                    self._update_index("students", lambda index: index.update(new) if new.is_student
+                                       else index.remove(new.user_id))
+                elif kind == "books":
+                    if old is None:
+                        self._advance_counter("book_ids", new.book_id)
+                    if old is None or (old.title, old.author, old.isbn) != (new.title, new.author, new.isbn):
+                        self._update_index("catalog", lambda index: index.update(new))
+                elif kind == "reviews":
+                    self._update_index("ratings", lambda index: index.replace(old, new))
+                elif kind == "holds":
+                    if old is None:
+                        self._advance_counter("hold_ids", new.hold_id)
+                    self._update_index("holds", lambda index: index.replace(old, new))
+                elif new.return_date is not None:
+                    self._update_index("due", lambda index: index.remove(new.loan_id))
+                    self._update_index("loans", lambda index: index.remove(new))
+                else:
+                    if old is None:
+                        self._advance_counter("loan_ids", new.loan_id)
+                        self._update_index("recommendations",
+                                           lambda index: index.record(new.student, new.book_id, new.loan_id))
+                    else:
+                        self._update_index("loans", lambda index: index.remove(old))
+                    self._update_index("due", lambda index: index.add(new))
+                    self._update_index("loans", lambda index: index.add(new))
+
+            loans = [new for kind, _, new in changes if kind == "loans"]
+            if loans and event in ("loans_issued", "loans_returned"):
+                self._notify(event, loans)
+            elif loans:
+                for loan in loans:
+                    self._notify(event, loan)
+            else:
+                for kind, _, record in changes:
+                    if kind == "books":
+                        self._notify("book_added" if event == "books_imported" else event, record)
+                    elif kind == "reviews":
+                        self._notify(event, record)
+
+    def _index(self, name, records, build):
+        """Return the named index over records, rebuilding it if records were reloaded from disk."""
+        cached = self._indexes.get(name)
+        if cached is None or cached[0] is not records:
+            with span(f"{name} index", "index"):
+                cached = self._indexes[name] = (records, build(records.values()))
+        return cached[1]
+
+    def _update_index(self, name, change):
+        """Apply change(index) to the named index if it has been built."""
+        cached = self._indexes.get(name)
+        if cached is not None:
+            change(cached[1])
+
+    def _advance_counter(self, name, used_id):
+        """Make sure the named ID counter never hands out used_id or anything below it."""
+        cached = self._indexes.get(name)
+        if cached is not None:
+            records, counter = cached
+            self._indexes[name] = (records, itertools.count(max(next(counter), int(used_id) + 1)))
+
+    @property
+    def catalog(self):
+        """Full-text index over the books."""
+        return self._index("catalog", self.books, CatalogIndex)
+
+    @traced("filter")
+    def search_books(self, query, available_only=False, limit=None, within=None):
+        """Find books by title, author or ISBN prefix; an empty query lists every book.
+
+        within, if given, is an earlier result list to narrow down instead of
+        searching the whole catalogue, for a query that extends the earlier one.
+        """
+        books = self.books
+        if not query.strip():
+            candidates = within if within is not None else books.values()
+            matches = [book for book in candidates if not available_only or book.available_copies > 0]
+            return matches[:limit] if limit is not None else matches
+
+        within_ids = [book.book_id for book in within] if within is not None else None
+        return [books[book_id] for book_id in self.search_book_ids(query, available_only, limit, within_ids)]
+
+    def search_book_ids(self, query, available_only=False, limit=None, within=None):
+        """Like search_books, but with book IDs in and out, so a long result costs no Book lookups.
+
+        The student catalogue keeps only these and looks the Books up a page
+        at a time.
+        """
+        books = self.books
+        if not query.strip():
+            candidates = within if within is not None else books.keys()
+            if available_only:
+                candidates = (book_id for book_id in candidates if books[book_id].available_copies > 0)
+            return list(itertools.islice(candidates, limit))
+
+        where = (lambda book_id: books[book_id].available_copies > 0) if available_only else None
+        return self.catalog.search(query, limit=limit, where=where, within=within)
+
+    @property
+    def student_index(self):
+        """Trigram index over student names and IDs."""
+        return self._index("students", self.users,
+                           lambda users: StudentIndex(user for user in users if user.is_student))
+
+    @property
+    def due_index(self):
+        """Loans ordered by due date."""
+        return self._index("due", self.loans, DueDateIndex)
+
+    @property
+    def loan_index(self):
+        """Loan IDs grouped by student and by book."""
+        return self._index("loans", self.loans, LoanIndex)
+
+    @property
+    def rating_index(self):
+        """Review counts, rating sums and histograms per book."""
+        return self._index("ratings", self.reviews, RatingIndex)
+
+    def book_rating(self, book_id):
+        """(average rating, number of reviews) of a book; the average is None if it has none."""
+        return self.rating_index.summary(book_id)
+
+    def sort_by_rating(self, books):
+        """Books best rated first; books without reviews follow in their original order."""
+        all_books = self.books
+        return [all_books[book_id] for book_id in self.rating_index.sort([book.book_id for book in books])]
+
+    def user_review(self, book_id, student_id):
+        return self.reviews.get(review_key(book_id, student_id))
+
+    @property
+    def hold_queues(self):
+        """Each book's queue of holds and the ready holds' expiry wheel."""
+        return self._index("holds", self.holds, HoldQueues)
+
+    def student_holds(self, student_id):
+        """(hold, position) of each of the student's holds; position is 0 once a copy is ready for them."""
+        queues = self.hold_queues
+        return [(hold, queues.position(hold)) for hold in queues.student_holds(student_id)]
+
+    @property
+    def recommendation_index(self):
+        """Co-borrowing counts, from the cached batch plus the loans issued since.
+
+        The index outlives reloads of the loans: after one, only the loans
+        issued since the last loan it counted are added, and the cache file is
+        not read again.  Without a cache file it starts out empty; counting
+        the whole history is left to build_recommendations, which is too slow
+        for the app's worker thread.
+        """
+        loans = self.loans
+        cached = self._indexes.get("recommendations")
+        if cached is not None and cached[0] is loans:
+            return cached[1]
+        index = cached[1] if cached is not None else self._load_recommendations()
+        with span("recommendations index", "index"):
+            for loan in sorted((loan for loan in loans.values() if int(loan.loan_id) > index.last_loan_id),
+                               key=lambda loan: int(loan.loan_id)):
+                index.record(loan.student, loan.book_id, loan.loan_id)
+        self._indexes["recommendations"] = (loans, index)
+        return index
+
+    def _load_recommendations(self):
+        try:
+            with open(self.recommendations_file, 'r') as f:
+                return CoBorrowIndex.from_json(json.load(f))
+        except (OSError, ValueError):
+            return CoBorrowIndex()
+
+    @traced("index")
+    def build_recommendations(self):
+        """Recount the co-borrowed books over the whole loan history and cache them in recommendations_file.
+
+        Meant to run as a batch job (python orchids.py recommend); the app
+        never builds them itself.
+        """
+        loans = self.loans
+        index = CoBorrowIndex.from_history(self.backend.loan_archive(), loans.values())
+        atomic_write_json(self.recommendations_file, index.to_json(), compact=True)
+        self._indexes["recommendations"] = (loans, index)
+        return index
+
+    def also_borrowed(self, book_id, k=5):
+        """Up to k books that students who borrowed book_id also borrowed, most often first."""
+        books = self.books
+        return [books[other] for other in self.recommendation_index.recommend(book_id, k) if other in books]
+
+    def recommend_for_student(self, student_id, k=5):
+        """Up to k books often borrowed with the ones the student borrowed lately."""
+        books = self.books
+        return [books[book_id] for book_id in self.recommendation_index.recommend_for_student(student_id, k)
+                if book_id in books]
+
+    @traced("filter")
+    def find_students(self, query, limit=5):
+        """Typo-tolerant student lookup by name or ID, best matches first."""
+        users = self.users
+        return [users[student_id] for student_id in self.student_index.search(query, limit=limit)]
+
+    def students(self):
+        return [user for user in self.users.values() if user.is_student]
+
+    def grades(self):
+        """The grades (classes) students are in, sorted."""
+        return sorted({user.grade for user in self.users.values() if user.is_student and user.grade})
+
+    def class_list(self, grade):
+        """The students in a grade, by name."""
+        return sorted((user for user in self.users.values() if user.is_student and user.grade == grade),
+                      key=lambda user: user.name)
+
+    def books_by_barcode(self, codes):
+        """Look up scanned barcodes, each a book ID or ISBN; returns the books found and the codes that were not."""
+        books = self.books
+        by_isbn = {}
+        for book in books.values():
+            by_isbn.setdefault(book.isbn.replace("-", ""), book)
+        found, unknown = [], []
+        for code in codes:
+            book = books.get(code) or by_isbn.get(code.replace("-", ""))
+            if book is not None:
+                found.append(book)
+            else:
+                unknown.append(code)
+        return found, unknown
+
+    def user_loans(self, student_id):
+        loans = self.loans
+        return [loans[loan_id] for loan_id in self.loan_index.student_loan_ids(student_id)]
+
+    def book_loans(self, book_id):
+        """The loans of every copy of a book that is currently issued."""
+        loans = self.loans
+        return [loans[loan_id] for loan_id in self.loan_index.book_loan_ids(book_id)]
+
+    def borrowers(self):
+        """Students who currently have at least one book issued."""
+        users = self.users
+        return [users[student_id] for student_id in self.loan_index.borrower_ids() if student_id in users]
+
+    def get_library_stats(self):
+        return len(self.loans), self.due_index.overdue_count()
+
+    def overdue_loans(self, today=None):
+        loans = self.loans
+        return [loans[loan_id] for loan_id in self.due_index.overdue_loan_ids(today)]
+
+    def loan_history(self, student_id=None):
+        """Returned loans, oldest return first, optionally for one student only."""
+        history = self.backend.loan_history()
+        if student_id is not None:
+            history = [loan for loan in history if loan.student == student_id]
+        return history
+
+    @traced("filter")
+    def loan_report(self, start=None, end=None, top=10):
+        """Borrowing report over the loans returned from DATE_FORMAT date start to end, both optional and inclusive.
+
+        Returns {"loans", "top_titles": [(title, loans)], "average_loan_days",
+        "overdue_ratio", "grades": {grade: {...}}}; see library_analytics.
+        """
+        return loan_report(self.backend.loan_archive(), self.users, self.books,
+                           date_ordinal(start) if start else None, date_ordinal(end) if end else None, top)
+
+    def authenticate(self, username, password):
+        """Return the user if the password is right, otherwise None.
+
+        Raises LoginThrottled, without checking the password, while the
+        account is locked after failed attempts.  A plaintext or outdated
+        password hash is replaced with a current one.
+        """
+        self.login_throttle.check(username)
+        user = self.users.get(username)
+        if user is None:
+            waste_verification(password)
+        elif verify_password(user.password, password):
+            self.login_throttle.succeeded(username)
+            if needs_rehash(user.password):
+                self.set_password(username, password)
+            return user
+        self.login_throttle.failed(username)
+        return None
+
+    # Mutations
+
+    def set_password(self, user_id, password):
+        with self.backend.transaction():
+            user = self.users.get(user_id)
+            if user is None:
+                raise LibraryError("User not found!")
+            user.password = hash_password(password)
+            self._commit("password_changed", user, users=[user])
+        return user
+
+    def hash_plaintext_passwords(self):
+        """Hash every password still stored as plaintext, in one commit; returns how many there were."""
+        with self.backend.transaction():
+            users = [user for user in self.users.values() if not is_hashed(user.password)]
+            for user in users:
+                user.password = hash_password(user.password)
+            if users:
+                self.backend.commit(event="passwords_hashed", users=users)
+        return len(users)
+
+    def _new_book_id(self):
+        counter = self._index("book_ids", self.books, lambda books: itertools.count(1 + max(
+            (int(book.book_id) for book in books), default=0)))
+        return str(next(counter))
+
+    def add_book(self, title, author, isbn, copies):
+        return self.add_books([(title, author, isbn, copies)])[0]
+
+    def add_books(self, entries):
+        """Add several books with a single commit.
+
+        entries are (title, author, isbn, copies) tuples; returns the new Books.
+        """
+        with self.backend.transaction():
+            books = self.books
+            added = []
+            for title, author, isbn, copies in entries:
+                book = Book(self._new_book_id(), title, author, isbn, copies, copies)
+                books[book.book_id] = book
+                self.catalog.add(book)
+                added.append(book)
+            if not added:
+                return added
+
+            self.backend.commit(event="book_added" if len(added) == 1 else "books_imported", books=added)
+        for book in added:
+            self._notify("book_added", book)
+        return added
+
+    def update_book(self, book_id, title=None, author=None, isbn=None, total_copies=None):
+        """Edit a book's details; changing total_copies adjusts the available copies by the same amount."""
+        with self.backend.transaction():
+            book = self.books.get(book_id)
+            if book is None:
+                raise LibraryError("Book not found!")
+
+            ready = []
+            if total_copies is not None:
+                on_loan = book.total_copies - book.available_copies
+                if total_copies < on_loan:
+                    raise LibraryError(f"{on_loan} copies are currently issued or held; total copies cannot be lower.")
+                book.available_copies = total_copies - on_loan
+                book.total_copies = total_copies
+                # New copies go to the students queueing for the book first
+                while book.available_copies > 0 and self.hold_queues.next_waiting(book_id) is not None:
+                    book.available_copies -= 1
+                    ready.append(self._pass_on_copy(book))
+            if title is not None:
+                book.title = title
+            if author is not None:
+                book.author = author
+            if isbn is not None:
+                book.isbn = isbn
+
+            self.catalog.update(book)
+            self._commit("book_updated", book, books=[book], holds=ready)
+            for hold in ready:
+                self._notify("hold_ready", hold)
+        return book
+
+    def _new_loan_id(self):
+        """Loan IDs are never reused, so every loan in the history keeps a unique ID."""
+        counter = self._index("loan_ids", self.loans, lambda loans: itertools.count(1 + self.backend.last_loan_id()))
+        return str(next(counter))
+
+    def _check_student(self, student_id, message="Student not found!"):
+        """Raise LibraryError unless student_id is a student's account; every change made for a student checks this."""
+        student = self.users.get(student_id)
+        if student is None or not student.is_student:
+            raise LibraryError(message)
+
+    def issue_book(self, book_id, student_id, due_date):
+        """Lend one copy of a book to a student.
+
+        Raises ValueError for a malformed due date and LibraryError for an
+        unknown student or when the book has no copies left.
+        """
+        datetime.strptime(due_date, DATE_FORMAT)
+
+        # Checked and changed under the library lock, so two terminals cannot both take the last copy.
+        with self.backend.transaction():
+            self._check_student(student_id)
+            books = self.books
+            book = books.get(book_id)
+            hold = self.hold_queues.student_hold(book_id, student_id)
+            # A ready hold means a copy has already been set aside for this student
+            kept = hold is not None and hold.is_ready
+            if book is None or (book.available_copies <= 0 and not kept):
+                raise LibraryError("Selected book is no longer available!")
+
+            loan = self._lend(book, student_id, due_date, hold)
+            self._commit("loan_issued", loan, books=[book], loans=[loan], removed_holds=[hold] if hold else [])
+        return loan
+
+    def _lend(self, book, student_id, due_date, hold):
+        """Make a new loan of a copy of book, taken from the shelf or, for a ready hold, the one kept for it."""
+        loan_id = self._new_loan_id()
+        loan = Loan(loan_id, book.book_id, student_id, datetime.now().strftime(DATE_FORMAT), due_date)
+
+        if hold is None or not hold.is_ready:
+            book.available_copies -= 1
+        if hold is not None:
+            del self.holds[hold.hold_id]
+            self.hold_queues.remove(hold)
+        self.loans[loan_id] = loan
+        self.due_index.add(loan)
+        self.loan_index.add(loan)
+        self._update_index("recommendations", lambda index: index.record(student_id, book.book_id, loan_id))
+        return loan
+
+    def issue_books(self, pairs, due_date):
+        """Lend several books with a single commit, e.g. a class set of a textbook.
+
+        pairs are (book ID, student ID) tuples.  Every loan is checked before
+        any is made, so either all are issued or, when a book is unknown or
+        has too few copies for all its students, LibraryError is raised and
+        none is.  Returns the new Loans.
+        """
+        datetime.strptime(due_date, DATE_FORMAT)
+        pairs = list(dict.fromkeys(pairs))
+
+        with self.backend.transaction():
+            books, holds = self.books, self.hold_queues
+            needed = Counter()
+            for book_id, student_id in pairs:
+                if book_id not in books:
+                    raise LibraryError(f"Book {book_id} not found!")
+                self._check_student(student_id, f"Student {student_id} not found!")
+                hold = holds.student_hold(book_id, student_id)
+                if hold is None or not hold.is_ready:
+                    needed[book_id] += 1
+            for book_id, count in needed.items():
+                book = books[book_id]
+                if count > book.available_copies:
+                    raise LibraryError(f"'{book.title}' has {book.available_copies} copies available "
+                                       f"but {count} are needed!")
+
+            issued, used_holds = [], []
+            for book_id, student_id in pairs:
+                hold = holds.student_hold(book_id, student_id)
+                issued.append(self._lend(books[book_id], student_id, due_date, hold))
+                if hold is not None:
+                    used_holds.append(hold)
+            if not issued:
+                return issued
+
+            changed_books = {loan.book_id: books[loan.book_id] for loan in issued}
+            self.backend.commit(event="loans_issued", books=list(changed_books.values()), loans=issued,
+                                removed_holds=used_holds)
+        self._notify("loans_issued", issued)
+        return issued
+
+    def return_book(self, loan_id):
+        """Return a loan; returns None if it is not (or no longer) on loan."""
+        with self.backend.transaction():
+            loans = self.loans
+            loan = loans.pop(loan_id, None)
+            if loan is None:
+                return None
+
+            loan.return_date = datetime.now().strftime(DATE_FORMAT)
+            book = self.books.get(loan.book_id)
+            ready = self._pass_on_copy(book) if book is not None else None
+            self.due_index.remove(loan_id)
+            self.loan_index.remove(loan)
+            self._commit("loan_returned", loan, books=[book] if book else [], returned_loans=[loan],
+                         holds=[ready] if ready else [])
+            if ready is not None:
+                self._notify("hold_ready", ready)
+        return loan
+
+    def return_books(self, loan_ids):
+        """Return several loans with a single commit; loans not (or no longer) on loan are skipped.
+
+        Returns the returned Loans.
+        """
+        with self.backend.transaction():
+            loans, books = self.loans, self.books
+            returned, changed_books, ready = [], {}, []
+            return_date = datetime.now().strftime(DATE_FORMAT)
+            for loan_id in dict.fromkeys(loan_ids):
+                loan = loans.pop(loan_id, None)
+                if loan is None:
+                    continue
+                loan.return_date = return_date
+                book = books.get(loan.book_id)
+                if book is not None:
+                    changed_books[book.book_id] = book
+                    passed_to = self._pass_on_copy(book)
+                    if passed_to is not None:
+                        ready.append(passed_to)
+                self.due_index.remove(loan_id)
+                self.loan_index.remove(loan)
+                returned.append(loan)
+            if not returned:
+                return returned
+
+            self.backend.commit(event="loans_returned", books=list(changed_books.values()), returned_loans=returned,
+                                holds=ready)
+        self._notify("loans_returned", returned)
+        for hold in ready:
+            self._notify("hold_ready", hold)
+        return returned
+
+    def _pass_on_copy(self, book):
+        """Keep a copy that has come back for the first hold in the book's queue, or put it back on the shelf.
+
+        Returns the hold the copy is now kept for, or None.
+        """
+        holds = self.hold_queues
+        waiting = holds.next_waiting(book.book_id)
+        if waiting is None:
+            book.available_copies += 1
+            return None
+        ready = Hold(waiting.hold_id, waiting.book_id, waiting.student, waiting.placed_date,
+                     ordinal_date(date.today().toordinal() + HOLD_DAYS))
+        self.holds[ready.hold_id] = ready
+        holds.replace(waiting, ready)
+        return ready
+
+    def _new_hold_id(self):
+        counter = self._index("hold_ids", self.holds, lambda holds: itertools.count(1 + max(
+            (int(hold.hold_id) for hold in holds), default=0)))
+        return str(next(counter))
+
+    def place_hold(self, book_id, student_id):
+        """Queue a student for a book that has no copies left; returns the Hold.
+
+        Raises LibraryError for an unknown student or book, a book with
+        copies on the shelf, or one the student already holds or has on loan.
+        """
+        with self.backend.transaction():
+            self._check_student(student_id)
+            book = self.books.get(book_id)
+            if book is None:
+                raise LibraryError("Book not found!")
+            if book.available_copies > 0:
+                raise LibraryError("Copies of this book are available; borrow one at the desk.")
+            holds = self.hold_queues
+            if holds.student_hold(book_id, student_id) is not None:
+                raise LibraryError("You already have a hold on this book!")
+            if any(loan.book_id == book_id for loan in self.user_loans(student_id)):
+                raise LibraryError("You already have this book on loan!")
+
+            hold = Hold(self._new_hold_id(), book_id, student_id, datetime.now().strftime(DATE_FORMAT))
+            self.holds[hold.hold_id] = hold
+            holds.add(hold)
+            self._commit("hold_placed", hold, holds=[hold])
+        return hold
+
+    def cancel_hold(self, hold_id):
+        """Take a hold off its queue; a copy kept for it passes to the next hold.  Returns None if there is no such hold."""
+        with self.backend.transaction():
+            holds = self.hold_queues
+            hold = self.holds.pop(hold_id, None)
+            if hold is None:
+                return None
+            holds.remove(hold)
+            book = self.books.get(hold.book_id) if hold.is_ready else None
+            ready = self._pass_on_copy(book) if book is not None else None
+            self._commit("hold_cancelled", hold, books=[book] if book else [], holds=[ready] if ready else [],
+                         removed_holds=[hold])
+            if ready is not None:
+                self._notify("hold_ready", ready)
+        return hold
+
+    def expire_holds(self, today=None):
+        """Drop the ready holds not picked up by their expiry date, passing their copies on; returns them.
+
+        Only the days since the last call are looked at, not every hold.
+        """
+        today = (today or date.today()).toordinal()
+        with self.backend.transaction():
+            holds = self.hold_queues
+            expired = holds.expired(today)
+            if not expired:
+                holds.checked(today)
+                return expired
+            changed_books, ready = {}, []
+            for hold in expired:
+                del self.holds[hold.hold_id]
+                holds.remove(hold)
+                book = self.books.get(hold.book_id)
+                if book is not None:
+                    changed_books[book.book_id] = book
+                    passed_to = self._pass_on_copy(book)
+                    if passed_to is not None:
+                        ready.append(passed_to)
+            self.backend.commit(event="holds_expired", books=list(changed_books.values()), holds=ready,
+                                removed_holds=expired)
+            # Only now that the removals are saved can these days be skipped next time
+            holds.checked(today)
+        for hold in expired:
+            self._notify("hold_expired", hold)
+        for hold in ready:
+            self._notify("hold_ready", hold)
+        return expired
+
+    def add_review(self, book_id, student_id, rating, comment=""):
+        """Rate a book from 1 to 5 stars; a student's new review of a book replaces their earlier one.
+
+        Raises ValueError for any other rating and LibraryError for an unknown
+        student or book, or a book the student has never borrowed.
+        """
+        if not isinstance(rating, int) or not 1 <= rating <= 5:
+            raise ValueError("Rating must be a whole number from 1 to 5")
+
+        with self.backend.transaction():
+            self._check_student(student_id)
+            if book_id not in self.books:
+                raise LibraryError("Book not found!")
+            if (all(loan.book_id != book_id for loan in self.user_loans(student_id))
+                    and not self.backend.has_returned(student_id, book_id)):
+                raise LibraryError("You can only review books you have borrowed!")
+            reviews = self.reviews
+            ratings = self.rating_index
+            review = Review(book_id, student_id, rating, comment.strip())
+            old = reviews.get(review.key)
+            reviews[review.key] = review
+            ratings.replace(old, review)
+            self._commit("review_added", review, reviews=[review])
+        return review
+
+    def apply_fine(self, loan_id, amount=FINE_AMOUNT):
+        with self.backend.transaction():
+            loan = self.loans.get(loan_id)
+            if loan is None:
+                return None
+
+            loan.fine += amount
+            self._commit("loan_fined", loan, loans=[loan])
+        return loan
+
+
+def open_store(sqlite_file=SQLITE_FILE):
+    """Open the library store, preferring the SQLite database once it has been migrated."""
+    if os.path.exists(sqlite_file) and os.path.getsize(sqlite_file) > 0:
+        from library_sqlite import SqliteBackend
+        return LibraryStore(SqliteBackend(sqlite_file))
+    return LibraryStore()
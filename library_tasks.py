@@ -0,0 +1,183 @@
+"""Background work for the Orchids library GUI.
+
+Tk may only be used from the thread running the mainloop, and anything slow
+done on that thread freezes the window.  TaskRunner runs library work
+(loading, searching, saving) on a worker thread and calls the result
+callbacks back on the mainloop thread, which checks for finished work with
+root.after about once a frame while anything is pending.
+
+The pool has a single worker thread on purpose: LibraryStore is not
+thread-safe, so that thread is the only one that touches it, and work runs in
+the order it was submitted.
+
+LiveSearch builds search-as-you-type on top of it for an entry box.
+"""
+import queue
+import sys
+import threading
+import tkinter
+from concurrent.futures import ThreadPoolExecutor
+
+from library_trace import tracer
+
+# Check for finished work once per frame at 60 fps while any is pending, and less often when idle.
+BUSY_POLL_MS = 16
+IDLE_POLL_MS = 100
+# Wait this long after the last keystroke before searching.
+DEBOUNCE_MS = 250
+
+
+class TaskRunner:
+    def __init__(self, root, max_workers=1):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="library-worker")
+        self._finished = queue.SimpleQueue()   # (future, on_done, on_error, owner) ready for the mainloop
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._busy = False
+        self._busy_observers = []
+        self._poll_id = None
+        self._poll()
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def bind_busy(self, observer):
+        """Call observer(busy) on the mainloop thread whenever work starts or all work has finished."""
+        self._busy_observers.append(observer)
+
+    def submit(self, work, *args, on_done=None, on_error=None, owner=None):
+        """Run work(*args) on the worker thread.
+
+        on_done(result) or on_error(exception) is then called on the mainloop
+        thread; errors without an on_error go to Tk's usual error report.  If
+        owner is a widget that has been destroyed by then (say the user moved
+        to another screen), the callbacks are skipped.  May be called from any
+        thread; returns the Future.
+        """
+        action = tracer.current_action()
+        if action is not None:
+            # Keep timing the work and its callbacks as part of the action that submitted them
+            work, on_done, on_error = (tracer.bind(action, function) for function in (work, on_done, on_error))
+
+        with self._lock:
+            self._pending += 1
+        future = self._executor.submit(work, *args)
+        future.add_done_callback(lambda future: self._finished.put((future, on_done, on_error, owner)))
+        if threading.current_thread() is threading.main_thread():
+            self._update_busy()
+        return future
+
+    def _update_busy(self):
+        busy = self.busy
+        if busy != self._busy:
+            self._busy = busy
+            for observer in list(self._busy_observers):
+                observer(busy)
+
+    def _poll(self):
+        while True:
+            try:
+                future, on_done, on_error, owner = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._pending -= 1
+            if future.cancelled() or (owner is not None and not owner.winfo_exists()):
+                continue
+
+            try:
+                error = future.exception()
+                if error is None:
+                    if on_done is not None:
+                        on_done(future.result())
+                elif on_error is not None:
+                    on_error(error)
+                else:
+                    self.root.report_callback_exception(type(error), error, error.__traceback__)
+            except Exception:
+                self.root.report_callback_exception(*sys.exc_info())
+
+        self._update_busy()
+        self._poll_id = self.root.after(BUSY_POLL_MS if self.busy else IDLE_POLL_MS, self._poll)
+
+    def shutdown(self):
+        """Stop polling and wait for the work already submitted to finish."""
+        if self._poll_id is not None:
+            try:
+                self.root.after_cancel(self._poll_id)
+            except tkinter.TclError:
+                pass  # the window has already been destroyed
+            self._poll_id = None
+        self._executor.shutdown(wait=True)
+
+
+class LiveSearch:
+    """Search-as-you-type for an entry box.
+
+    search(term) runs on the worker thread and show(results, term) on the
+    mainloop thread.  Keystrokes are debounced, and a query that a newer one
+    has replaced is cancelled if it has not started yet and ignored if it has.
+    When refine(results, term) is given and the new term extends the last one
+    searched, it is used to narrow those results instead of searching again,
+    so it must only ever return a subset of what it is given.
+    """
+
+    def __init__(self, entry, tasks, search, show, refine=None, delay_ms=DEBOUNCE_MS):
+        self.entry = entry
+        self.tasks = tasks
+        self.search = search
+        self.show = show
+        self.refine = refine
+        self.delay_ms = delay_ms
+
+        self._after_id = None
+        self._future = None
+        self._generation = 0
+        self._requested = None  # the term of the newest query
+        self._last = None       # (term, results) of the newest query shown
+
+        entry.bind("<KeyRelease>", self._on_key, add="+")
+
+    def _on_key(self, event):
+        if self._after_id is not None:
+            self.entry.after_cancel(self._after_id)
+        self._after_id = self.entry.after(self.delay_ms, self._run)
+
+    def search_now(self):
+        """Search the current term straight away, from scratch, e.g. after the data changed."""
+        if self._after_id is not None:
+            self.entry.after_cancel(self._after_id)
+        self._last = None
+        self._run(force=True)
+
+    def _run(self, force=False):
+        self._after_id = None
+        if not self.entry.winfo_exists():
+            return
+        term = self.entry.get().strip().lower()
+        if term == self._requested and not force:
+            return
+        self._requested = term
+        if self._future is not None:
+            self._future.cancel()
+
+        last = self._last
+        if self.refine is not None and last is not None and last[0] and term.startswith(last[0]):
+            work = lambda: self.refine(last[1], term)
+        else:
+            work = lambda: self.search(term)
+
+        self._generation += 1
+        generation = self._generation
+        with tracer.action(getattr(self.search, "__name__", "search")):
+            self._future = self.tasks.submit(work, on_done=lambda results: self._done(generation, term, results),
+                                             owner=self.entry)
+
+    def _done(self, generation, term, results):
+        if generation != self._generation:
+            return
+        self._future = None
+        self._last = (term, results)
+        self.show(results, term)
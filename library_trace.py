@@ -0,0 +1,256 @@
+"""Lightweight tracing for finding out where the library app spends its time.
+
+Tracing is off unless the ORCHIDS_TRACE environment variable is set, and
+then costs one attribute check per traced call:
+
+    ORCHIDS_TRACE=1             keep recent timings for the admin Performance window
+    ORCHIDS_TRACE=trace.json    also write them as a Chrome trace on exit (chrome://tracing or Perfetto)
+    ORCHIDS_TRACE=trace.jsonl   also write them as one JSON object per line on exit
+
+Every span has a category: "parse" (reading the data files), "index"
+(building search indexes), "filter" (searching and picking records), "build"
+(creating widgets) or "save" (writing changes).  An action span groups
+everything done for one thing the user did, including the work TaskRunner
+runs for it on the worker thread, so each action can be broken down into
+time spent per category.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+CATEGORIES = ("parse", "index", "filter", "build", "save")
+# Spans and actions kept in memory; older ones are dropped.
+MAX_SPANS = 20_000
+MAX_ACTIONS = 200
+
+
+class Action:
+    """One user action and the time spent on it per category."""
+
+    __slots__ = ("name", "start", "end", "phases", "widgets")
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = start
+        self.phases = dict.fromkeys(CATEGORIES, 0.0)
+        self.widgets = 0
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "action", "start", "children", "widgets", "previous_action")
+
+    def __init__(self, tracer, name, category, args, action=None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.action = action
+        self.children = 0.0  # time spent in spans nested directly inside this one
+
+    def __enter__(self):
+        local = self.tracer._local
+        stack = local.__dict__.setdefault("stack", [])
+        stack.append(self)
+        if self.action is not None:
+            self.previous_action = getattr(local, "action", None)
+            local.action = self.action
+        self.widgets = self.tracer.widgets_created
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        local = self.tracer._local
+        local.stack.pop()
+        if self.action is not None:
+            local.action = self.previous_action
+        self.tracer._finish(self, end, local)
+
+
+class _NoSpan:
+    """What span() returns while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    def __init__(self, max_spans=MAX_SPANS, max_actions=MAX_ACTIONS):
+        self.enabled = False
+        self.widgets_created = 0
+        self.spans = deque(maxlen=max_spans)       # (name, category, thread id, start, duration, args)
+        self.actions = deque(maxlen=max_actions)
+        self.thread_names = {}
+        self._epoch = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            _count_widgets(self)
+
+    def span(self, name, category, **args):
+        """Time a with block under the given name and category."""
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, category, args)
+
+    def action(self, name):
+        """Time a with block as a new user action; spans inside it are added up per category."""
+        if not self.enabled:
+            return _NO_SPAN
+        action = Action(name, time.perf_counter())
+        with self._lock:
+            self.actions.append(action)
+        return _Span(self, name, "action", {}, action)
+
+    def current_action(self):
+        if not self.enabled:
+            return None
+        return getattr(self._local, "action", None)
+
+    def bind(self, action, function):
+        """Wrap function so that, on whichever thread it runs, its spans count towards action."""
+        if function is None:
+            return None
+
+        @functools.wraps(function)
+        def run_in_action(*args, **kwargs):
+            local = self._local
+            previous = getattr(local, "action", None)
+            local.action = action
+            try:
+                return function(*args, **kwargs)
+            finally:
+                local.action = previous
+        return run_in_action
+
+    def _finish(self, span, end, local):
+        duration = end - span.start
+        if span.category == "build":
+            span.args["widgets"] = self.widgets_created - span.widgets
+        if local.stack:
+            local.stack[-1].children += duration
+        thread = threading.get_ident()
+        action = getattr(local, "action", None)
+        with self._lock:
+            self.spans.append((span.name, span.category, thread, span.start, duration, span.args))
+            if thread not in self.thread_names:
+                self.thread_names[thread] = threading.current_thread().name
+            if span.action is not None:
+                span.action.end = max(span.action.end, end)
+            elif action is not None:
+                action.end = max(action.end, end)
+                # Each span adds only the time not spent in nested spans, so nothing is counted twice.
+                if span.category in action.phases:
+                    action.phases[span.category] += duration - span.children
+                if span.category == "build" and not any(outer.category == "build" for outer in local.stack):
+                    action.widgets += span.args["widgets"]
+
+    def recent_actions(self):
+        with self._lock:
+            return list(self.actions)
+
+    def export_chrome(self, path):
+        """Write the recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": name}}
+                  for thread, name in thread_names.items()]
+        events += [{"name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+                    "ts": round((start - self._epoch) * 1e6, 1), "dur": round(duration * 1e6, 1), "args": args}
+                   for name, category, thread, start, duration, args in spans]
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def export_jsonl(self, path):
+        """Write the recorded spans as one JSON object per line, times in milliseconds."""
+        with self._lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+        with open(path, 'w') as f:
+            for name, category, thread, start, duration, args in spans:
+                f.write(json.dumps({"name": name, "category": category, "thread": thread_names.get(thread, thread),
+                                    "start_ms": round((start - self._epoch) * 1000, 3),
+                                    "duration_ms": round(duration * 1000, 3), **args}) + "\n")
+
+    def export(self, path):
+        if path.endswith(".jsonl"):
+            self.export_jsonl(path)
+        else:
+            self.export_chrome(path)
+
+
+def _count_widgets(tracer):
+    """Count every Tk widget created from now on; CustomTkinter widgets are built out of several."""
+    import tkinter
+
+    original_init = tkinter.BaseWidget.__init__
+
+    @functools.wraps(original_init)
+    def counting_init(widget, *args, **kwargs):
+        tracer.widgets_created += 1
+        original_init(widget, *args, **kwargs)
+
+    tkinter.BaseWidget.__init__ = counting_init
+
+
+def format_actions(actions):
+    """A text table of actions, newest first, with milliseconds per category."""
+    columns = ("total",) + CATEGORIES + ("other",)
+    lines = [f"{'action':<28}" + "".join(f"{column:>9}" for column in columns) + f"{'widgets':>9}"]
+    for action in reversed(actions):
+        phases = [action.phases[category] for category in CATEGORIES]
+        times = [action.duration] + phases + [max(0.0, action.duration - sum(phases))]
+        lines.append(f"{action.name[:27]:<28}" + "".join(f"{seconds * 1000:>9.1f}" for seconds in times)
+                     + f"{action.widgets:>9}")
+    return "\n".join(lines)
+
+
+tracer = Tracer()
+span = tracer.span
+action = tracer.action
+
+
+def traced(category, name=None):
+    """Decorator that runs each call of a function in a span, or as a new action if category is "action"."""
+    def decorate(function):
+        label = name or (function.__name__ if category == "action" else function.__qualname__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.action(label) if category == "action" else tracer.span(label, category):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _configure(setting):
+    if not setting or setting == "0":
+        return
+    tracer.enable()
+    if setting != "1":
+        atexit.register(tracer.export, setting)
+
+
+_configure(os.environ.get("ORCHIDS_TRACE"))
@@ -0,0 +1,202 @@
+"""Reusable widgets for the Orchids library app.
+
+VirtualList shows a long list of records while only ever creating widgets for
+the rows that fit on screen.  The same row widgets are reused while the user
+scrolls; only their text is changed.  Rows are read from a PagedSource, which
+fetches records a page at a time.
+"""
+import customtkinter as ctk
+
+
+class PagedSource:
+    """Random access to a list of records that is fetched one page at a time.
+
+    fetch_page(offset, limit) must return the records in that slice.  The
+    most recently used pages are kept so scrolling back and forth does not
+    fetch the same page again.
+
+    Given submit (TaskRunner.submit), pages are fetched on the worker thread
+    instead: a record whose page has not arrived yet reads as None, and the
+    listener set with listen() is called once it has.  first_page, if
+    already fetched, is shown straight away.
+    """
+
+    def __init__(self, fetch_page, total, page_size=100, cached_pages=8, submit=None, first_page=None):
+        self.fetch_page = fetch_page
+        self.total = total
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self.submit = submit
+        self._pages = {} if first_page is None else {0: first_page}
+        self._requested = set()
+        self._on_loaded = None
+        self._owner = None
+
+    @classmethod
+    def from_list(cls, items, page_size=100):
+        return cls(lambda offset, limit: items[offset:offset + limit], len(items), page_size)
+
+    def __len__(self):
+        return self.total
+
+    def listen(self, on_loaded, owner=None):
+        """Call on_loaded() when a page fetched in the background arrives, unless widget owner is gone."""
+        self._on_loaded = on_loaded
+        self._owner = owner
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.total:
+            raise IndexError(index)
+        page_number, position = divmod(index, self.page_size)
+        page = self._pages.pop(page_number, None)
+        if page is None:
+            if self.submit is not None:
+                self._request(page_number)
+                return None
+            page = self.fetch_page(page_number * self.page_size, self.page_size)
+            self._make_room()
+        # Re-insert so the dict stays ordered from least to most recently used.
+        self._pages[page_number] = page
+        return page[position]
+
+    def _make_room(self):
+        if len(self._pages) >= self.cached_pages:
+            del self._pages[next(iter(self._pages))]
+
+    def _request(self, page_number):
+        if page_number not in self._requested:
+            self._requested.add(page_number)
+            self.submit(self.fetch_page, page_number * self.page_size, self.page_size,
+                        on_done=lambda page: self._loaded(page_number, page), owner=self._owner)
+
+    def _loaded(self, page_number, page):
+        self._requested.discard(page_number)
+        self._make_room()
+        self._pages[page_number] = page
+        if self._on_loaded is not None:
+            self._on_loaded()
+
+
+class VirtualList(ctk.CTkFrame):
+    """A scrollable list of fixed-height rows that only builds the visible ones.
+
+    make_row(parent, height) creates the widgets for one row and returns its
+    frame; fill_row(row, item) updates that frame to show a record, or a
+    placeholder for None while a page is fetched in the background.
+    """
+
+    def __init__(self, master, make_row, fill_row, row_height=90, height=500, source=None, **kwargs):
+        super().__init__(master, fg_color="transparent", height=height, **kwargs)
+        self.make_row = make_row
+        self.fill_row = fill_row
+        self.row_height = row_height
+        self.source = source or PagedSource.from_list([])
+
+        self._rows = []
+        self._offset = 0
+        self._first_shown = None
+        self._viewport_height = height
+
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent", height=height)
+        self.viewport.pack(side="left", fill="both", expand=True)
+        self.viewport.pack_propagate(False)
+
+        self.scrollbar = ctk.CTkScrollbar(self, orientation="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self._bind_wheel(self.viewport)
+        self.viewport.bind("<Configure>", self._on_resize)
+
+    # Public API
+
+    def set_source(self, source):
+        """Show a new set of records, scrolled back to the top."""
+        self.source = source
+        source.listen(self.refresh, owner=self)
+        self._offset = 0
+        self._first_shown = None
+        self._render()
+
+    def refresh(self):
+        """Redraw the visible rows, e.g. after the records they show have changed."""
+        self._first_shown = None
+        self._render()
+
+    # Scrolling
+
+    @property
+    def _content_height(self):
+        return len(self.source) * self.row_height
+
+    def _scroll_to(self, offset):
+        max_offset = max(0, self._content_height - self._viewport_height)
+        self._offset = min(max(0, offset), max_offset)
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(float(amount) * self._content_height)
+        elif action == "scroll":
+            step = self._viewport_height if unit == "pages" else self.row_height
+            self._scroll_to(self._offset + int(amount) * step)
+
+    def _on_wheel(self, event):
+        if event.num == 4:
+            direction = -1
+        elif event.num == 5:
+            direction = 1
+        else:
+            direction = -1 if event.delta > 0 else 1
+        self._scroll_to(self._offset + direction * self.row_height)
+        # Keep the surrounding scrollable frame from scrolling as well.
+        return "break"
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel)
+        widget.bind("<Button-4>", self._on_wheel)
+        widget.bind("<Button-5>", self._on_wheel)
+        for child in widget.winfo_children():
+            self._bind_wheel(child)
+
+    # Row pool
+
+    def _on_resize(self, event):
+        height = event.height / self._get_widget_scaling()
+        if abs(height - self._viewport_height) < 1 and self._rows:
+            return
+        self._viewport_height = height
+        self._ensure_rows()
+        self._scroll_to(self._offset)
+
+    def _ensure_rows(self):
+        needed = int(self._viewport_height // self.row_height) + 2
+        while len(self._rows) < needed:
+            row = self.make_row(self.viewport, self.row_height)
+            row.pack_propagate(False)
+            self._bind_wheel(row)
+            self._rows.append(row)
+        self._first_shown = None
+
+    def _render(self):
+        if not self._rows:
+            self._ensure_rows()
+
+        first, shift = divmod(int(self._offset), self.row_height)
+        total = len(self.source)
+        if first != self._first_shown:
+            for i, row in enumerate(self._rows):
+                if first + i < total:
+                    self.fill_row(row, self.source[first + i])
+            self._first_shown = first
+
+        for i, row in enumerate(self._rows):
+            if first + i < total:
+                row.place(x=0, y=i * self.row_height - shift, relwidth=1)
+            else:
+                row.place_forget()
+
+        if total:
+            content = self._content_height
+            self.scrollbar.set(self._offset / content, min(1.0, (self._offset + self._viewport_height) / content))
+        else:
+            self.scrollbar.set(0, 1)
@@ -0,0 +1,161 @@
+"""Command-line tools for the Orchids library app.
+
+    python orchids.py import new_books.csv     bulk-import books from CSV or MARC21
+    python orchids.py migrate                  copy the JSON data into orchids_library.db
+    python orchids.py serve --port 8080        run the HTTP/JSON API for other terminals
+    python orchids.py hash-passwords           hash any passwords still stored as plaintext
+    python orchids.py report --start 2024-09-01   borrowing report over the returned loans
+    python orchids.py recommend                rebuild the "also borrowed" recommendations (e.g. nightly)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from library_import import BATCH_SIZE, ImportFormatError, import_books
+from library_server import serve
+from library_sqlite import migrate_json_to_sqlite
+from library_store import SQLITE_FILE, LibraryError, open_store
+
+
+def run_import(args):
+    store = open_store()
+    store.init_data()
+
+    def report(result):
+        print(f"\r{result.fraction_done:6.1%}  {result.added} added, {result.duplicates} duplicates, "
+              f"{result.invalid} invalid", end="", flush=True)
+
+    try:
+        result = import_books(store, args.file, file_format=args.format, batch_size=args.batch_size,
+                              progress=report)
+    except (OSError, ImportFormatError, LibraryError) as e:
+        print(f"Import failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+
+    print()
+    print(result.summary())
+    for record_number, message in result.errors:
+        print(f"  record {record_number}: {message}")
+    return 0
+
+
+def run_migrate(args):
+    counts = migrate_json_to_sqlite(args.database)
+    print(f"Migrated {counts['users']} users, {counts['books']} books, {counts['loans']} loans, "
+          f"{counts['history']} returned loans, {counts['reviews']} reviews and {counts['holds']} holds "
+          f"into {args.database}")
+    return 0
+
+
+def run_serve(args):
+    store = open_store()
+    store.init_data()
+    store.close()
+
+    try:
+        asyncio.run(serve(open_store, args.host, args.port, pool_size=args.pool_size, token=args.token))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_hash_passwords(args):
+    store = open_store()
+    store.init_data()
+    try:
+        count = store.hash_plaintext_passwords()
+    finally:
+        store.close()
+    print(f"Hashed {count} plaintext passwords")
+    return 0
+
+
+def run_report(args):
+    store = open_store()
+    store.init_data()
+    try:
+        report = store.loan_report(args.start, args.end, args.top)
+    except ValueError:
+        print("Invalid date format! Use YYYY-MM-DD", file=sys.stderr)
+        return 1
+    finally:
+        store.close()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    def percent(ratio):
+        return f"{ratio:.1%}" if ratio is not None else "-"
+
+    print(f"{report['loans']} returned loans")
+    if report["average_loan_days"] is not None:
+        print(f"Average loan: {report['average_loan_days']:.1f} days, returned late: {percent(report['overdue_ratio'])}")
+    print("\nMost borrowed:")
+    for title, count in report["top_titles"]:
+        print(f"  {count:>7}  {title}")
+    print(f"\n{'grade':<16}{'students':>9}{'borrowers':>10}{'loans':>9}{'per student':>12}{'late':>8}")
+    for grade, rates in report["grades"].items():
+        per_student = f"{rates['loans_per_student']:.1f}" if rates["loans_per_student"] is not None else "-"
+        print(f"{grade[:15]:<16}{rates['students']:>9}{rates['borrowers']:>10}{rates['loans']:>9}{per_student:>12}"
+              f"{percent(rates['overdue_ratio']):>8}")
+    return 0
+
+
+def run_recommend(args):
+    store = open_store()
+    store.init_data()
+    try:
+        index = store.build_recommendations()
+    finally:
+        store.close()
+    print(f"Recommendations for {len(index)} books written to {store.recommendations_file}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="orchids", description="Orchids library command-line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="bulk-import books from a CSV or MARC21 file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=("csv", "marc"), help="default: guessed from the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser.set_defaults(handler=run_import)
+
+    migrate_parser = commands.add_parser("migrate", help="copy the JSON data files into the SQLite database")
+    migrate_parser.add_argument("--database", default=SQLITE_FILE)
+    migrate_parser.set_defaults(handler=run_migrate)
+
+    serve_parser = commands.add_parser("serve", help="run the HTTP/JSON API")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--pool-size", type=int, default=1,
+                              help="open store handles shared by requests (SQLite only; JSON always uses 1)")
+    serve_parser.add_argument("--token", default=os.environ.get("ORCHIDS_API_TOKEN"),
+                              help="require 'Authorization: Bearer <token>' (default: $ORCHIDS_API_TOKEN)")
+    serve_parser.set_defaults(handler=run_serve)
+
+    hash_parser = commands.add_parser("hash-passwords", help="hash any passwords still stored as plaintext")
+    hash_parser.set_defaults(handler=run_hash_passwords)
+
+    report_parser = commands.add_parser("report", help="top titles, loan durations and borrowing per grade")
+    report_parser.add_argument("--start", help="only loans returned on or after this date (YYYY-MM-DD)")
+    report_parser.add_argument("--end", help="only loans returned on or before this date (YYYY-MM-DD)")
+    report_parser.add_argument("--top", type=int, default=10, help="number of top titles (default: %(default)s)")
+    report_parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    report_parser.set_defaults(handler=run_report)
+
+    recommend_parser = commands.add_parser("recommend", help="rebuild the co-borrowing recommendations")
+    recommend_parser.set_defaults(handler=run_recommend)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
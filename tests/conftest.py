@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library_store import JsonBackend, LibraryStore  # noqa: E402
+
+USERS = {
+    "admin": {"password": "admin123", "role": "admin", "name": "Administrator"},
+    **{f"student{i}": {"password": f"pass{i}", "role": "student", "name": f"Student {i}", "grade": "Year 7"}
+       for i in range(1, 5)},
+}
+BOOKS = {
+    "1": {"title": "Python Programming", "author": "John Smith", "isbn": "978-0123456789",
+          "total_copies": 1, "available_copies": 1},
+    "2": {"title": "Data Science Basics", "author": "Mary Johnson", "isbn": "978-0987654321",
+          "total_copies": 3, "available_copies": 3},
+}
+DUE_DATE = "2099-01-01"
+
+
+def open_json_store(directory, **backend_options):
+    """A store on the data files in directory; stores opened on the same directory act as separate programs."""
+    def path(name):
+        return os.path.join(directory, name)
+
+    backend = JsonBackend(path("users.json"), path("books.json"), path("borrowed_books.json"), path("reviews.json"),
+                          path("holds.json"), path("library_events.jsonl"), path("loan_history.jsonl"),
+                          path("library_checkpoint.json"), path("library.lock"), path("library_compaction.lock"),
+                          archive_dir=path("loan_archive"), stat_interval=0, **backend_options)
+    store = LibraryStore(backend, recommendations_file=path("recommendations.json"))
+    store.init_data()
+    return store
+
+
+@pytest.fixture
+def library_dir(tmp_path):
+    """A data folder with four students and a book with a single copy (book "1")."""
+    (tmp_path / "users.json").write_text(json.dumps(USERS))
+    (tmp_path / "books.json").write_text(json.dumps(BOOKS))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def store(library_dir):
+    return open_json_store(library_dir)
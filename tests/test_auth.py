@@ -0,0 +1,71 @@
+import pytest
+
+import library_auth
+from conftest import open_json_store
+from library_auth import LoginThrottle, LoginThrottled, hash_password, is_hashed, needs_rehash, verify_password
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashes(monkeypatch):
+    """Hash with a tiny work factor; the real one takes tenths of a second per password."""
+    monkeypatch.setattr(library_auth, "SCRYPT_N", 2 ** 4)
+    monkeypatch.setattr(library_auth, "PBKDF2_ITERATIONS", 1000)
+
+
+def test_hash_round_trip():
+    stored = hash_password("s3cret")
+    assert is_hashed(stored) and not needs_rehash(stored)
+    assert stored != hash_password("s3cret")  # salted
+    assert verify_password(stored, "s3cret")
+    assert not verify_password(stored, "s3cre")
+    assert not verify_password("scrypt$broken", "s3cret")
+
+
+def test_pbkdf2_fallback_and_rehash(monkeypatch):
+    monkeypatch.setattr(library_auth, "HAS_SCRYPT", False)
+    stored = hash_password("s3cret")
+    assert stored.startswith("pbkdf2_sha256$") and verify_password(stored, "s3cret")
+    monkeypatch.setattr(library_auth, "HAS_SCRYPT", True)
+    assert needs_rehash(stored) and verify_password(stored, "s3cret")
+
+
+def test_plaintext_password_is_upgraded_on_login(library_dir):
+    store = open_json_store(library_dir)
+    assert store.users["student1"].password == "pass1"
+
+    assert store.authenticate("student1", "wrong") is None
+    assert store.authenticate("student1", "pass1").user_id == "student1"
+
+    stored = store.users["student1"].password
+    assert is_hashed(stored) and verify_password(stored, "pass1")
+    assert open_json_store(library_dir).users["student1"].password == stored  # committed
+    assert store.hash_plaintext_passwords() == 4
+    assert store.hash_plaintext_passwords() == 0
+    assert store.authenticate("admin", "admin123").is_admin
+
+
+def test_failed_logins_lock_the_account(store):
+    now = [0.0]
+    store.login_throttle = LoginThrottle(free_attempts=2, base_delay=10, max_delay=25, clock=lambda: now[0])
+
+    for _ in range(2):
+        assert store.authenticate("student1", "wrong") is None
+    with pytest.raises(LoginThrottled) as locked:
+        store.authenticate("student1", "pass1")  # refused without checking the password
+    assert locked.value.retry_after == 10
+    store.authenticate("student2", "pass2")  # other accounts are not affected
+
+    now[0] = 10
+    assert store.authenticate("student1", "wrong") is None
+    with pytest.raises(LoginThrottled) as locked:
+        store.authenticate("student1", "pass1")
+    assert locked.value.retry_after == 20  # doubled
+
+    now[0] = 30
+    assert store.authenticate("student1", "pass1").user_id == "student1"
+    assert store.authenticate("student1", "wrong") is None  # a success starts the count again
+
+    for _ in range(2):
+        store.authenticate("nobody", "guess")
+    with pytest.raises(LoginThrottled):
+        store.authenticate("nobody", "guess")
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from conftest import DUE_DATE, open_json_store
+from library_sqlite import SqliteBackend, migrate_json_to_sqlite
+from library_store import LibraryError, LibraryStore
+
+
+def open_sqlite_store(request, directory):
+    store = LibraryStore(SqliteBackend(os.path.join(directory, "library.db")),
+                         recommendations_file=os.path.join(directory, "recommendations.json"))
+    request.addfinalizer(store.backend.close)
+    return store
+
+
+@pytest.fixture
+def sqlite_dir(library_dir, monkeypatch):
+    """library_dir with its JSON files migrated into library.db."""
+    monkeypatch.chdir(library_dir)
+    migrate_json_to_sqlite("library.db")
+    return library_dir
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def any_store(request, library_dir):
+    """The sample library on the JSON files or, migrated, in a SQLite database."""
+    if request.param == "json":
+        return open_json_store(library_dir)
+    return open_sqlite_store(request, request.getfixturevalue("sqlite_dir"))
+
+
+MUTATIONS = {
+    "issue_book": lambda store, student: store.issue_book("2", student, DUE_DATE),
+    "issue_books": lambda store, student: store.issue_books([("2", "student2"), ("2", student)], DUE_DATE),
+    "place_hold": lambda store, student: store.place_hold("1", student),
+    "add_review": lambda store, student: store.add_review("1", student, 5),
+}
+
+
+@pytest.mark.parametrize("mutation", MUTATIONS)
+@pytest.mark.parametrize("student", ["nobody", "admin"])
+def test_changes_for_unknown_students_are_refused(any_store, mutation, student):
+    any_store.issue_book("1", "student1", DUE_DATE)  # so book "1" can be held
+
+    with pytest.raises(LibraryError, match="not found"):
+        MUTATIONS[mutation](any_store, student)
+
+    assert [loan.student for loan in any_store.loans.values()] == ["student1"]
+    assert any_store.books["2"].available_copies == 3
+    assert not any_store.holds
+    assert not any_store.reviews
+
+
+def test_sqlite_reads_only_the_rows_other_connections_changed(request, sqlite_dir):
+    store = open_sqlite_store(request, sqlite_dir)
+    other = open_sqlite_store(request, sqlite_dir)
+    loans, books, holds = other.loans, other.books, other.holds
+    other.loan_index  # built before the changes below, so they reach it without a rebuild
+    events = []
+    other.subscribe(lambda event, record: events.append(event))
+
+    returned = store.issue_book("1", "student1", DUE_DATE)
+    store.place_hold("1", "student2")
+    store.return_book(returned.loan_id)
+    kept = store.issue_books([("2", "student3"), ("2", "student4")], DUE_DATE)
+
+    assert other.loans is loans and other.books is books and other.holds is holds
+    assert set(loans) == {loan.loan_id for loan in kept}
+    assert books["1"].available_copies == 0 and books["2"].available_copies == 1
+    assert [hold.student for hold in holds.values()] == ["student2"] and next(iter(holds.values())).is_ready
+    assert [loan.loan_id for loan in other.user_loans("student3")] == [kept[0].loan_id]
+    assert events == ["loan_issued", "loan_returned", "loans_issued"]
+    assert other.issue_book("1", "student2", DUE_DATE).loan_id not in {returned.loan_id, kept[0].loan_id,
+                                                                        kept[1].loan_id}
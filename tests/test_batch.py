@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import DUE_DATE, open_json_store
+from library_store import LibraryError
+
+
+def test_issue_books_is_all_or_nothing(store):
+    with pytest.raises(LibraryError, match="1 copies available but 2 are needed"):
+        store.issue_books([("2", "student1"), ("1", "student1"), ("1", "student2")], DUE_DATE)
+    with pytest.raises(LibraryError, match="Book 9 not found"):
+        store.issue_books([("2", "student1"), ("9", "student1")], DUE_DATE)
+    with pytest.raises(LibraryError, match="Student nobody not found"):
+        store.issue_books([("2", "student1"), ("2", "nobody")], DUE_DATE)
+    with pytest.raises(ValueError):
+        store.issue_books([("2", "student1")], "next week")
+
+    assert not store.loans
+    assert store.books["1"].available_copies == 1 and store.books["2"].available_copies == 3
+    assert store.issue_books([], DUE_DATE) == []
+
+
+def test_issue_books_once_per_pair_with_one_commit_and_event(library_dir):
+    store = open_json_store(library_dir)
+    events = []
+    store.subscribe(lambda event, record: events.append((event, record)))
+
+    issued = store.issue_books([("2", "student1"), ("2", "student2"), ("2", "student1"), ("1", "student1")],
+                               DUE_DATE)
+
+    assert [(loan.book_id, loan.student) for loan in issued] == [("2", "student1"), ("2", "student2"),
+                                                                 ("1", "student1")]
+    assert len({loan.loan_id for loan in issued}) == 3
+    assert events == [("loans_issued", issued)]
+    assert store.books["2"].available_copies == 1 and store.books["1"].available_copies == 0
+    assert [loan.loan_id for loan in store.user_loans("student1")] == [issued[0].loan_id, issued[2].loan_id]
+    reopened = open_json_store(library_dir)
+    assert set(reopened.loans) == {loan.loan_id for loan in issued}
+    assert reopened.books["2"].available_copies == 1
+
+
+def test_issue_books_uses_the_copy_kept_for_a_hold(store):
+    loan = store.issue_book("1", "student1", DUE_DATE)
+    store.place_hold("1", "student2")
+    store.place_hold("1", "student3")
+    store.return_book(loan.loan_id)  # kept for student2
+
+    with pytest.raises(LibraryError, match="0 copies available"):
+        store.issue_books([("1", "student3")], DUE_DATE)  # still waiting
+
+    issued = store.issue_books([("1", "student2"), ("2", "student3")], DUE_DATE)
+    assert [loan.student for loan in issued] == ["student2", "student3"]
+    assert store.books["1"].available_copies == 0
+    assert [hold.student for hold in store.holds.values()] == ["student3"]
+
+
+def test_return_books_skips_unknown_and_repeated_loans(store):
+    issued = store.issue_books([("1", "student1"), ("2", "student1"), ("2", "student2")], DUE_DATE)
+    store.place_hold("1", "student3")
+    events = []
+    store.subscribe(lambda event, record: events.append(event))
+
+    returned = store.return_books([issued[0].loan_id, issued[1].loan_id, issued[0].loan_id, "no such loan"])
+
+    assert [loan.loan_id for loan in returned] == [issued[0].loan_id, issued[1].loan_id]
+    assert all(loan.return_date for loan in returned)
+    assert set(store.loans) == {issued[2].loan_id}
+    assert store.books["1"].available_copies == 0  # kept for student3
+    assert store.books["2"].available_copies == 2
+    assert events == ["loans_returned", "hold_ready"]
+    assert store.return_books([issued[0].loan_id]) == []
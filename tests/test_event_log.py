@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+
+from conftest import DUE_DATE, open_json_store
+from library_store import JsonBackend, LibraryError
+
+
+def read_events(directory):
+    with open(os.path.join(directory, "library_events.jsonl")) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_torn_last_line_is_skipped_then_cut_off(library_dir):
+    store = open_json_store(library_dir)
+    first = store.issue_book("2", "student1", DUE_DATE)
+    with open(os.path.join(library_dir, "library_events.jsonl"), "ab") as f:
+        # A crash in the middle of appending the next event
+        f.write(b'{"seq": 2, "event": "loan_issued", "loans": {"99": {"book_id": "2", "stud')
+
+    reopened = open_json_store(library_dir)
+    assert list(reopened.loans) == [first.loan_id]
+    assert reopened.books["2"].available_copies == 2
+
+    second = reopened.issue_book("2", "student2", DUE_DATE)
+    assert [event["seq"] for event in read_events(library_dir)] == [1, 2]
+    final = open_json_store(library_dir)
+    assert set(final.loans) == {first.loan_id, second.loan_id}
+    assert final.books["2"].available_copies == 1
+
+
+def test_append_during_compaction_is_kept(library_dir, monkeypatch):
+    store = open_json_store(library_dir)
+    other = open_json_store(library_dir)
+    returned = store.issue_book("2", "student1", DUE_DATE)
+    store.return_book(returned.loan_id)
+    kept = store.issue_book("2", "student2", DUE_DATE)
+
+    # Another program issues a book while the compaction writes the snapshots without the lock
+    racing = []
+    append = store.backend.archive.append
+
+    def append_while_another_program_issues(loans, seq):
+        racing.append(other.issue_book("1", "student3", DUE_DATE))
+        return append(loans, seq)
+
+    monkeypatch.setattr(store.backend.archive, "append", append_while_another_program_issues)
+    store.backend.compact()
+
+    assert len(racing) == 1
+    assert [event["loans"].keys() for event in read_events(library_dir)] == [{racing[0].loan_id}]
+    for reader in (store, other, open_json_store(library_dir)):
+        assert set(reader.loans) == {kept.loan_id, racing[0].loan_id}
+        assert reader.books["1"].available_copies == 0
+        assert reader.books["2"].available_copies == 2
+    assert [loan.loan_id for loan in store.backend.loan_history()] == [returned.loan_id]
+    assert len(store.backend.loan_archive()) == 1
+
+
+def issue_last_copy(directory, student, barrier, results):
+    store = open_json_store(directory)
+    store.books  # both programs see the copy on the shelf before they race for it
+    barrier.wait()
+    try:
+        store.issue_book("1", student, DUE_DATE)
+        results.put("issued")
+    except LibraryError:
+        results.put("refused")
+
+
+def test_two_programs_cannot_both_issue_the_last_copy(library_dir):
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(2)
+    results = context.Queue()
+    processes = [context.Process(target=issue_last_copy, args=(library_dir, student, barrier, results))
+                 for student in ("student1", "student2")]
+    for process in processes:
+        process.start()
+    outcomes = sorted(results.get(timeout=60) for _ in processes)
+    for process in processes:
+        process.join(timeout=60)
+
+    assert outcomes == ["issued", "refused"]
+    store = open_json_store(library_dir)
+    assert len(store.loans) == 1
+    assert store.books["1"].available_copies == 0
+
+
+def test_loan_ids_stay_unique_without_reading_the_history(library_dir, monkeypatch):
+    store = open_json_store(library_dir)
+    issued = [store.issue_book("2", "student1", DUE_DATE)]
+    store.return_book(issued[0].loan_id)
+    store.backend.compact()
+    with open(os.path.join(library_dir, "library_checkpoint.json")) as f:
+        assert json.load(f)["last_loan_id"] == int(issued[0].loan_id)
+
+    def fail():
+        raise AssertionError("the loan history was read to pick a loan ID")
+
+    monkeypatch.setattr(JsonBackend, "loan_history", lambda self: fail())
+    other = open_json_store(library_dir)  # the returned loan is only in the history now
+    issued.append(other.issue_book("2", "student2", DUE_DATE))
+    other.return_book(issued[1].loan_id)
+    issued.append(store.issue_book("2", "student3", DUE_DATE))  # the other program's loan reaches it by replay
+    issued.append(open_json_store(library_dir).issue_book("2", "student4", DUE_DATE))
+
+    assert len({loan.loan_id for loan in issued}) == 4
@@ -0,0 +1,153 @@
+from datetime import date
+
+import pytest
+
+from conftest import DUE_DATE, open_json_store
+from library_holds import HOLD_DAYS, WHEEL_SLOTS, ExpiryWheel, HoldQueues
+from library_store import Hold, LibraryError, ordinal_date
+
+
+def test_wheel_expires_only_days_before_today():
+    wheel = ExpiryWheel()
+    wheel.add("a", 100)
+    wheel.add("b", 101)
+    wheel.add("c", 100 + WHEEL_SLOTS)  # same slot as "a", a whole turn later
+
+    assert wheel.expire(100) == []
+    assert wheel.expire(101) == ["a"]
+    assert sorted(wheel.expire(102)) == ["b"]
+    assert len(wheel) == 1
+    assert wheel.expire(101 + WHEEL_SLOTS) == ["c"]
+
+
+def test_wheel_after_more_than_a_turn_and_late_adds():
+    wheel = ExpiryWheel()
+    wheel.expire(10)
+    wheel.add("late", 5)  # already past when added
+    wheel.add("later", 40)
+    wheel.remove("later", 40)
+    wheel.add("far", 20)
+
+    assert sorted(wheel.expire(10 + 3 * WHEEL_SLOTS)) == ["far", "late"]
+    assert len(wheel) == 0
+
+
+def test_wheel_keeps_due_keys_until_they_are_removed():
+    wheel = ExpiryWheel()
+    wheel.add("a", 100)
+    wheel.add("b", 103)
+    assert wheel.due(102) == {"a": 100}
+    assert wheel.due(102) == {"a": 100}  # nothing removed yet
+
+    wheel.advance(102)  # "a" was not removed, say because saving its removal failed
+    wheel.add("c", 101)  # added late
+    assert wheel.due(102) == {"a": 100, "c": 101}
+    assert sorted(wheel.expire(104)) == ["a", "b", "c"]
+    assert len(wheel) == 0
+
+
+def test_expired_holds_stay_queued_until_removed():
+    expiry = date(2030, 1, 1).toordinal()
+    ready = Hold("1", "1", "student1", "2029-12-29", ordinal_date(expiry))
+    queues = HoldQueues([ready])
+    assert queues.expired(expiry + 1) == [ready]
+    queues.checked(expiry + 1)  # the removal was never saved
+    assert queues.expired(expiry + 2) == [ready]
+
+    queues.remove(ready)
+    queues.checked(expiry + 2)
+    assert queues.expired(expiry + 100) == []
+
+
+def hold_students(store):
+    """(student, position) of every hold on book "1", first in line first."""
+    holds = [hold for hold in store.holds.values() if hold.book_id == "1"]
+    return sorted(((hold.student, store.hold_queues.position(hold)) for hold in holds), key=lambda entry: entry[1])
+
+
+def lend_last_copy_and_queue(store, *students):
+    loan = store.issue_book("1", "student1", DUE_DATE)
+    for student in students:
+        store.place_hold("1", student)
+    return loan
+
+
+def test_place_hold_checks(store):
+    with pytest.raises(LibraryError):
+        store.place_hold("1", "student2")  # a copy is on the shelf
+    lend_last_copy_and_queue(store, "student2")
+    with pytest.raises(LibraryError):
+        store.place_hold("1", "student2")  # already queued
+    with pytest.raises(LibraryError):
+        store.place_hold("1", "student1")  # already borrowed
+    for nobody in ("nobody", "admin"):
+        with pytest.raises(LibraryError, match="Student not found"):
+            store.place_hold("1", nobody)
+    assert [hold.student for hold in store.holds.values()] == ["student2"]
+
+
+def test_return_hands_copy_to_first_in_line(store):
+    events = []
+    store.subscribe(lambda event, record: events.append((event, getattr(record, "student", None))))
+    loan = lend_last_copy_and_queue(store, "student2", "student3")
+    assert hold_students(store) == [("student2", 1), ("student3", 2)]
+
+    store.return_book(loan.loan_id)
+
+    assert hold_students(store) == [("student2", 0), ("student3", 1)]
+    assert store.books["1"].available_copies == 0
+    assert ("hold_ready", "student2") in events
+    ready = store.hold_queues.student_hold("1", "student2")
+    assert ready.expiry_ordinal == date.today().toordinal() + HOLD_DAYS
+
+    with pytest.raises(LibraryError):
+        store.issue_book("1", "student3", DUE_DATE)  # the copy is kept for student2
+    store.issue_book("1", "student2", DUE_DATE)
+    assert hold_students(store) == [("student3", 1)]
+    assert store.books["1"].available_copies == 0
+
+
+def test_cancel_passes_kept_copy_on(store):
+    loan = lend_last_copy_and_queue(store, "student2", "student3", "student4")
+    waiting = store.hold_queues.student_hold("1", "student3")
+    store.cancel_hold(waiting.hold_id)
+    assert hold_students(store) == [("student2", 1), ("student4", 2)]
+
+    store.return_book(loan.loan_id)
+    store.cancel_hold(store.hold_queues.student_hold("1", "student2").hold_id)
+    assert hold_students(store) == [("student4", 0)]
+
+    store.cancel_hold(store.hold_queues.student_hold("1", "student4").hold_id)
+    assert hold_students(store) == []
+    assert store.books["1"].available_copies == 1
+    assert store.cancel_hold("no such hold") is None
+
+
+def test_expired_hold_passes_copy_on_then_back_to_shelf(store):
+    loan = lend_last_copy_and_queue(store, "student2", "student3")
+    store.return_book(loan.loan_id)
+    expiry = store.hold_queues.student_hold("1", "student2").expiry_ordinal
+
+    assert store.expire_holds(date.fromordinal(expiry)) == []  # still valid on its last day
+    expired = store.expire_holds(date.fromordinal(expiry + 1))
+    assert [hold.student for hold in expired] == ["student2"]
+    assert hold_students(store) == [("student3", 0)]
+
+    later = store.hold_queues.student_hold("1", "student3").expiry_ordinal
+    store.expire_holds(date.fromordinal(later + 1))
+    assert hold_students(store) == []
+    assert store.books["1"].available_copies == 1
+
+
+def test_holds_persist_and_replay_across_programs(library_dir):
+    store = open_json_store(library_dir)
+    other = open_json_store(library_dir)
+    other.hold_queues  # built before the changes below, so they reach it by replay
+    loan = lend_last_copy_and_queue(store, "student2", "student3")
+    store.return_book(loan.loan_id)
+
+    assert hold_students(other) == [("student2", 0), ("student3", 1)]
+    assert hold_students(open_json_store(library_dir)) == [("student2", 0), ("student3", 1)]
+
+    store.backend.compact()
+    assert hold_students(open_json_store(library_dir)) == [("student2", 0), ("student3", 1)]
@@ -0,0 +1,90 @@
+import pytest
+
+from library_import import (FIELD_TERMINATOR, RECORD_TERMINATOR, SUBFIELD_DELIMITER, ImportFormatError, import_books,
+                            is_valid_isbn, normalize_isbn)
+
+
+def test_isbn_check_digits():
+    assert is_valid_isbn(normalize_isbn("978-0-306-40615-7"))
+    assert is_valid_isbn(normalize_isbn("0-8044-2957-x"))
+    assert not is_valid_isbn(normalize_isbn("978-0-306-40615-8"))
+    assert not is_valid_isbn(normalize_isbn("0-306-40615-3"))
+    assert not is_valid_isbn("12345")
+
+
+def write_csv(tmp_path, text, encoding="utf-8-sig"):
+    path = tmp_path / "books.csv"
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_csv_import_skips_bad_and_duplicate_records(store, tmp_path):
+    path = write_csv(tmp_path, "\r\n".join([
+        "Book Title,Author Name,ISBN-13,Qty",     # the BOM and header aliases are understood
+        "Café Society,Anne Author,978-0-306-40615-7,2",
+        "Second Copy,Anne Author,9780306406157,1",  # same ISBN as the line above
+        "Bad Check Digit,Ben Author,978-0-306-40615-8,1",
+        "No Copies,Cy Author,0-306-40615-2,0",
+        "Many Copies,Cy Author,0-306-40615-2,lots",
+        ",Missing Title,0-8044-2957-X,1",
+        "Ten Digits,Di Author,0-8044-2957-x,",  # no copies given means one
+        "",
+    ]))
+    batches = []
+
+    result = import_books(store, path, batch_size=1, progress=lambda result: batches.append(result.added))
+
+    assert (result.added, result.duplicates, result.invalid) == (2, 1, 4)
+    assert [number for number, _ in result.errors] == [3, 4, 5, 6]
+    assert "invalid ISBN" in result.errors[0][1] and "copies" in result.errors[1][1]
+    assert batches == [1, 2, 2] and result.fraction_done == 1.0
+    added = {book.title: book for book in store.books.values() if book.book_id not in ("1", "2")}
+    assert set(added) == {"Café Society", "Ten Digits"}
+    assert added["Café Society"].total_copies == 2 and added["Ten Digits"].total_copies == 1
+
+    # Importing the same file again finds only duplicates
+    assert import_books(store, path).duplicates == 3
+
+
+def test_csv_errors_stop_the_import(store, tmp_path):
+    with pytest.raises(ImportFormatError, match="no isbn column"):
+        import_books(store, write_csv(tmp_path, "title,author\nA,B\n"))
+    with pytest.raises(ImportFormatError, match="not UTF-8"):
+        import_books(store, write_csv(tmp_path, "title,author,isbn\nCaf\xe9,B,9780306406157\n", "latin-1"))
+
+
+def marc_record(fields):
+    """An ISO 2709 record from (tag, indicators, [(code, value)]) data fields."""
+    directory, data = b"", b""
+    for tag, indicators, subfields in fields:
+        body = indicators.encode() + b"".join(bytes([SUBFIELD_DELIMITER]) + code.encode() + value.encode("utf-8")
+                                              for code, value in subfields) + bytes([FIELD_TERMINATOR])
+        directory += tag.encode() + b"%04d%05d" % (len(body), len(data))
+        data += body
+    base_address = 24 + len(directory) + 1
+    length = base_address + len(data) + 1
+    leader = b"%05dnam a22%05d   4500" % (length, base_address)
+    return leader + directory + bytes([FIELD_TERMINATOR]) + data + bytes([RECORD_TERMINATOR])
+
+
+def test_marc_import(store, tmp_path):
+    path = tmp_path / "books.mrc"
+    path.write_bytes(marc_record([
+        ("020", "  ", [("a", "9780262033848 (hardcover)")]),
+        ("100", "1 ", [("a", "Cormen, Thomas H.,")]),
+        ("245", "10", [("a", "Introduction to algorithms /"), ("b", "third edition.")]),
+    ]) + marc_record([
+        ("245", "10", [("a", "No ISBN here")]),
+    ]))
+
+    result = import_books(store, str(path))
+
+    assert (result.added, result.invalid) == (1, 1)
+    book = next(book for book in store.books.values() if book.book_id not in ("1", "2"))
+    assert (book.title, book.author, book.isbn) == ("Introduction to algorithms / third edition", "Cormen, Thomas H",
+                                                    "9780262033848")
+
+    truncated = tmp_path / "truncated.mrc"
+    truncated.write_bytes(path.read_bytes()[:-10])
+    with pytest.raises(ImportFormatError, match="middle of a record"):
+        import_books(store, str(truncated))
@@ -0,0 +1,72 @@
+import json
+import os
+
+from conftest import DUE_DATE, open_json_store
+from library_analytics import LoanColumns
+from library_recommend import KEEP, WINDOW, CoBorrowIndex
+
+# (student, book) in the order the books were borrowed
+BORROWINGS = [("s1", "a"), ("s1", "b"), ("s1", "c"), ("s2", "a"), ("s2", "b"), ("s3", "b"), ("s3", "c"),
+              ("s3", "b"), ("s4", "d")]
+
+
+def history(borrowings):
+    columns = LoanColumns()
+    for day, (student, book) in enumerate(borrowings, start=1):
+        columns.append(book, student, day, day + 14, day + 7, 0)
+    return columns
+
+
+def test_index_counts_books_borrowed_by_the_same_student():
+    index = CoBorrowIndex.from_history(history(BORROWINGS))
+
+    assert set(index.recommend("b")) == {"a", "c"}  # twice each
+    assert index.recommend("a") == ["b", "c"]  # a and b went together twice
+    assert index.recommend("a", k=1) == ["b"]
+    assert index.recommend("d") == [] and index.recommend("unknown") == []
+    assert index.recommend_for_student("s4") == []
+    assert index.recommend_for_student("s2") == ["c"]  # a and b are left out, the student has them
+
+
+def test_recording_loans_one_by_one_matches_a_batch_build():
+    built = CoBorrowIndex.from_history(history(BORROWINGS))
+    recorded = CoBorrowIndex()
+    for loan_id, (student, book) in enumerate(BORROWINGS, start=1):
+        recorded.record(student, book, str(loan_id))
+
+    assert recorded.to_json()["books"] == built.to_json()["books"]
+    assert recorded.last_loan_id == len(BORROWINGS)
+    restored = CoBorrowIndex.from_json(json.loads(json.dumps(recorded.to_json())))
+    assert restored.to_json() == recorded.to_json()
+    assert restored.recommend_for_student("s2") == ["c"]
+
+
+def test_only_a_window_of_recent_books_and_the_top_books_are_kept():
+    borrowings = [("s1", f"book{i}") for i in range(WINDOW + 5)]
+    index = CoBorrowIndex.from_history(history(borrowings))
+    assert "book0" not in index.recommend(f"book{WINDOW + 4}", k=WINDOW + 5)
+    assert len(index.recommend(f"book{WINDOW}", k=100)) <= KEEP
+
+    index.record("s2", "book0")
+    index.record("s2", "book1")
+    index.record("s2", "book1")  # borrowing a book again counts nothing new
+    assert index.recommend("book0", k=1) == ["book1"]
+    assert index.to_json()["books"]["book0"][0] == ["book1", 2]
+
+
+def test_store_keeps_the_index_across_reloads(library_dir):
+    store = open_json_store(library_dir)
+    first = store.issue_book("1", "student1", DUE_DATE)
+    store.issue_book("2", "student1", DUE_DATE)
+    assert [book.book_id for book in store.also_borrowed("1")] == ["2"]
+
+    store.return_book(first.loan_id)
+    store.backend.compact()
+    store.build_recommendations()
+    assert os.path.exists(os.path.join(library_dir, "recommendations.json"))
+
+    reopened = open_json_store(library_dir)
+    reopened.issue_book("2", "student2", DUE_DATE)
+    reopened.issue_book("1", "student2", DUE_DATE)  # counted on top of the cached batch
+    assert reopened.recommendation_index.to_json()["books"]["1"] == [["2", 2]]
+    assert [book.book_id for book in reopened.recommend_for_student("student3")] == []
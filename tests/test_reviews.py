@@ -0,0 +1,27 @@
+import pytest
+
+from conftest import DUE_DATE, open_json_store
+from library_store import LibraryError, review_key
+
+
+def test_only_students_who_borrowed_a_book_can_review_it(library_dir):
+    store = open_json_store(library_dir)
+    for reviewer in ("nobody", "admin"):
+        with pytest.raises(LibraryError, match="Student not found"):
+            store.add_review("2", reviewer, 5)
+    with pytest.raises(LibraryError, match="borrowed"):
+        store.add_review("2", "student1", 5)
+    with pytest.raises(LibraryError, match="Book not found"):
+        store.add_review("9", "student1", 5)
+
+    current = store.issue_book("2", "student1", DUE_DATE)
+    store.add_review("2", "student1", 4)
+    returned = store.issue_book("1", "student2", DUE_DATE)
+    store.return_book(returned.loan_id)
+    store.backend.compact()  # the returned loan is only in the history now
+    reopened = open_json_store(library_dir)
+    reopened.add_review("1", "student2", 3, "  Good  ")
+
+    assert reopened.book_rating("2") == (4.0, 1)
+    assert reopened.reviews[review_key("1", "student2")].comment == "Good"
+    assert current.loan_id in reopened.loans
@@ -0,0 +1,76 @@
+from library_search import NARROW_COST, CatalogIndex, tokenize
+from library_store import Book
+
+BOOKS = [
+    Book("1", "Python Programming", "John Smith", "978-0123456789", 1, 1),
+    Book("2", "Data Science Basics", "Mary Johnson", "978-0987654321", 3, 3),
+    Book("3", "Programming Pearls", "Jon Bentley", "978-0201657883", 2, 0),
+    Book("4", "The Python Cookbook", "David Beazley", "978-1449340377", 1, 1),
+    Book("5", "Pythonic Patterns", "Ann Python", "978-1111111111", 1, 1),
+]
+
+
+def test_tokens_keep_isbns_whole():
+    assert tokenize("Data-Science 978-0123-45x") == ["data", "science", "978012345x"]
+
+
+def test_every_term_is_a_prefix():
+    index = CatalogIndex(BOOKS)
+    assert set(index.search("pyth")) == {"1", "4", "5"}
+    assert index.search("97801234") == ["1"]
+    assert index.search("xyz") == []
+    assert index.search("  ") == []
+
+
+def test_all_terms_must_match():
+    index = CatalogIndex(BOOKS)
+    assert index.search("python prog") == ["1"]
+    assert index.search("prog pearls") == ["3"]
+    assert index.search("python science") == []
+
+
+def test_exact_words_beat_prefixes_and_titles_beat_authors():
+    index = CatalogIndex(BOOKS)
+    # "Python" as a whole title word, then "Pythonic" in a title, then "Python" as an author
+    assert index.search("python") == ["1", "4", "5"]
+    assert index.search("python", limit=2) == ["1", "4"]
+    assert index.search("python", where=lambda book_id: book_id != "1") == ["4", "5"]
+
+
+def test_narrowing_an_earlier_result_matches_a_full_search():
+    books = BOOKS + [Book(str(i), f"Filler {i}", "Programmer", "978-2222222222", 1, 1) for i in range(6, 60)]
+    index = CatalogIndex(books)
+    earlier = index.search("pro")
+    assert len(earlier) * NARROW_COST > len(books)  # so many that the postings are still expanded
+    for query in ("prog", "progr", "programming p", "pro pearls"):
+        assert index.search(query, within=earlier) == index.search(query)
+
+    # Two common words seldom found together: the few earlier results are scored book by book instead
+    books = ([Book(str(i), f"Alpha {i}", "Gamma", "1", 1, 1) for i in range(20)]
+             + [Book(str(i), f"Delta {i}", "Beta", "1", 1, 1) for i in range(20, 40)]
+             + [Book("40", "Alpha Special", "Beta", "1", 1, 1), Book("41", "Beta Alpha", "Anon", "1", 1, 1)])
+    index = CatalogIndex(books)
+    earlier = index.search("alph bet")
+    assert earlier == ["41", "40"]
+    assert len(earlier) * NARROW_COST < 22
+    assert index.search("alpha beta", within=earlier) == index.search("alpha beta") == ["41", "40"]
+
+
+def test_index_follows_added_changed_and_removed_books():
+    index = CatalogIndex(BOOKS)
+    assert index.search("pyth") == ["1", "4", "5"]  # cached ranking
+    index.add(Book("6", "Python Crash Course", "Eric Matthes", "978-1593279288", 1, 1))
+    index.update(Book("1", "Java Programming", "John Smith", "978-0123456789", 1, 1))
+    index.remove("5")
+    assert index.search("pyth") == ["4", "6"]
+    assert index.search("java") == ["1"]
+    assert len(index) == 5 and "5" not in index
+
+
+def test_store_search_ids_and_books(store):
+    store.issue_book("1", "student1", "2099-01-01")
+    assert [book.book_id for book in store.search_books("")] == ["1", "2"]
+    assert store.search_book_ids("", available_only=True) == ["2"]
+    assert store.search_book_ids("", limit=1) == ["1"]
+    assert [book.title for book in store.search_books("sci", within=store.search_books("da"))] == [
+        "Data Science Basics"]
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import DUE_DATE, open_json_store
+from library_server import LibraryServer, StorePool
+
+
+def request(library_dir, *requests, token=None):
+    """Send (method, target, body, headers) requests to a server on library_dir; returns (status, JSON) per request."""
+    async def run():
+        pool = StorePool(lambda: open_json_store(library_dir))
+        listener = await asyncio.start_server(LibraryServer(pool, token).handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        responses = []
+        try:
+            for method, target, body, headers in requests:
+                data = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else b""
+                head = f"{method} {target} HTTP/1.1\r\nContent-Length: {len(data)}\r\n"
+                head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+                writer.write(head.encode("latin-1") + b"\r\n" + data)
+                status = int((await reader.readline()).split()[1])
+                response_headers = {}
+                line = await reader.readline()
+                while line != b"\r\n":
+                    name, value = line.decode("latin-1").split(":", 1)
+                    response_headers[name.lower()] = value.strip()
+                    line = await reader.readline()
+                length = int(response_headers["content-length"])
+                responses.append((status, json.loads(await reader.readexactly(length))))
+        finally:
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+            pool.close()
+        return responses
+
+    return asyncio.run(run())
+
+
+def call(library_dir, method, target, body=None, headers=None, token=None):
+    return request(library_dir, (method, target, body, headers or {}), token=token)[0]
+
+
+def test_routes(library_dir):
+    responses = request(library_dir,
+                        ("GET", "/books?q=python", None, {}),
+                        ("GET", "/books/1", None, {}),
+                        ("POST", "/loans", {"book_id": "1", "student": "student1", "due_date": DUE_DATE}, {}),
+                        ("GET", "/loans?student=student1", None, {}),
+                        ("POST", "/loans/1/fine", {"amount": 3}, {}),
+                        ("POST", "/loans/1/return", None, {}),
+                        ("GET", "/stats/", None, {}))
+    assert [status for status, _ in responses] == [200, 200, 201, 200, 200, 200, 200]
+    books, book, loan, loans, fined, returned, stats = (payload for _, payload in responses)
+    assert [found["id"] for found in books] == ["1"]
+    assert book["title"] == "Python Programming" and book["loans"] == []
+    assert loan["student"] == "student1" and loans == [loan]
+    assert fined["fine"] == 3 and returned["return_date"]
+    assert stats == {"total_issued": 0, "overdue_count": 0, "books": 2}
+
+
+def test_token_is_required_when_set(library_dir):
+    assert call(library_dir, "GET", "/stats", token="secret")[0] == 401
+    assert call(library_dir, "GET", "/stats", headers={"Authorization": "Bearer wrong"}, token="secret")[0] == 401
+    assert call(library_dir, "GET", "/stats", headers={"Authorization": "Bearer secret"}, token="secret")[0] == 200
+
+
+@pytest.mark.parametrize("method, target, body, status, error", [
+    ("GET", "/nowhere", None, 404, "No such endpoint"),
+    ("GET", "/books/9", None, 404, "Book not found"),
+    ("POST", "/loans/9/return", None, 404, "Loan not found"),
+    ("DELETE", "/books", None, 405, "not allowed"),
+    ("POST", "/books", None, 405, "not allowed"),
+    ("POST", "/loans", b"{not json", 400, "not valid JSON"),
+    ("POST", "/loans", [1, 2], 400, "must be a JSON object"),
+    ("POST", "/loans", {"book_id": "1"}, 400, "required"),
+    ("POST", "/loans", {"book_id": "1", "student": "student1", "due_date": "01/01/2099"}, 400, "YYYY-MM-DD"),
+    ("POST", "/loans", {"book_id": "1", "student": "student1", "due_date": 20990101}, 400, "YYYY-MM-DD"),
+    ("POST", "/loans", {"book_id": "1", "student": "nobody"}, 404, "Student not found"),
+    ("POST", "/loans", {"book_id": "9", "student": "student1"}, 409, "no longer available"),
+    ("POST", "/loans/1/fine", {"amount": True}, 400, "positive whole number"),
+    ("POST", "/loans/1/fine", {"amount": -5}, 400, "positive whole number"),
+    ("GET", "/books?limit=many", None, 400, "whole number"),
+])
+def test_errors_are_json(library_dir, method, target, body, status, error):
+    got_status, payload = call(library_dir, method, target, body)
+    assert got_status == status
+    assert error in payload["error"]
+
+
+def test_unexpected_errors_are_500(library_dir, monkeypatch, capsys):
+    monkeypatch.setattr("library_server.library_stats", lambda store: int("not a number"))
+    assert call(library_dir, "GET", "/stats") == (500, {"error": "Internal server error"})
+    assert "ValueError" in capsys.readouterr().err